@@ -1,21 +1,49 @@
 import mesa_geo as mg
 import numpy as np
-from numpy.random import random
 from shapely.geometry import Point
 
 from utils import get_damage
-from constants import (FLOOD_DAMAGE_MAX, FLOOD_DAMAGE_THRESHOLD, MAX_DISTANCE,
+from households import HouseholdField, NORMAL, EVACUATED, DISPLACED, TRAPPED
+from households import STONE_BRICKS, CONCRETE, WOOD, MUD_BRICKS, INFORMAL_SETTLEMENTS
+from constants import (FLOOD_DAMAGE_MAX, FLOOD_DAMAGE_THRESHOLD, MATERIALS,
                        POVERTY_LINE)
-from constants import (STATUS_NORMAL, STATUS_EVACUATED, STATUS_DISPLACED, STATUS_TRAPPED)
-from constants import (MATERIAL_STONE_BRICKS, MATERIAL_CONCRETE, MATERIAL_WOOD, MATERIAL_MUD_BRICKS, MATERIAL_INFORMAL_SETTLEMENTS)
+from constants import (LOW_DAMAGE_THRESHOLD, MEDIUM_DAMAGE_THRESHOLD, BASE_RICOVERY)
 
 
-LOW_DAMAGE_THRESHOLD = 0.25
-MEDIUM_DAMAGE_THRESHOLD = 0.70
-BASE_RICOVERY = 0.30
-
 class HouseholdAgent(mg.GeoAgent):
-    """Household Agent."""
+    """
+    Household Agent.
+    The state is stored in the model Households arrays, status and house materials
+    are integer codes (constants.Status, constants.Material), mapped to names only for output.
+    """
+    # Agent parameters, stored in the model households arrays
+    base_income = HouseholdField()
+    flood_prone = HouseholdField()
+    household_size = HouseholdField()
+    house_materials = HouseholdField()
+    obstacles_to_movement = HouseholdField()
+
+    awareness = HouseholdField()
+    fear = HouseholdField()
+    trust = HouseholdField()
+
+    house_damage = HouseholdField()
+    livelihood_damage = HouseholdField()
+
+    # status, starts as normal
+    _status = HouseholdField('status')
+    # keep track of status changes from normal
+    status_changed = HouseholdField()
+
+    # received early warning
+    alerted = HouseholdField()
+    # received flood on last step
+    received_flood = HouseholdField()
+    last_house_damage = HouseholdField()
+    last_livelihood_damage = HouseholdField()
+    # prepared to flood
+    prepared = HouseholdField()
+    displacement_time = HouseholdField()
 
     def __init__(
         self,
@@ -23,6 +51,7 @@ class HouseholdAgent(mg.GeoAgent):
         model,
         geometry,
         crs,
+        index,
     ):
         """
         Create a new household agent.
@@ -30,41 +59,39 @@ class HouseholdAgent(mg.GeoAgent):
         :param model:       Model in which the agent runs
         :param geometry:    Shape object for the agent
         :param crs:         Coordinate reference system for the agent    
+        :param index:       Index of the agent in the model households arrays
         """
         super().__init__(unique_id, model, geometry, crs)
-        # Agent parameters
-        self.obstacles_to_movement = False
+        self.index = index
 
-        self.house_damage = 0
-        self.livelihood_damage = 0
+    def get_neighbours(self):
+        """
+        get all neighbors within a certain distance
+        from the model neighbour graph
+        """
+        return [
+            self.model.agents[i]
+            for i in self.model.neighbours.neighbours(self.index)
+        ]
 
-        # set initial status
-        self._status = STATUS_NORMAL
-        # keep track of status changes from normal
-        self.status_changed = False
-        
-        # received early warning
-        self.alerted = False
-        # received flood on last step
-        self.received_flood = False
-        self.last_house_damage = 0
-        self.last_livelihood_damage = 0
-        # prepared to flood
-        self.prepared = False
-        self.displacement_time = 0
+    def n_neighbours(self):
+        """
+        number of neighbours, including the household itself
+        """
+        return len(self.model.neighbours.neighbours(self.index))
 
-        self._neighbours = None
+    def count_neighbours(self, counter):
+        """
+        number of neighbours in the given counter of Households.NEIGHBOUR_COUNTERS
+        e.g. displaced, evacuated, prepared, flooded, high_damage
+        """
+        return self.model.households.neighbour_counts[counter][self.index]
 
-    def get_neighbours(self):
+    def random_draw(self, stage):
         """
-        get all neighbors within a certain distance
+        random number of the household for the given stage in the current step
         """
-        if self._neighbours is None:
-            self._neighbours = list(
-                self.model.space.get_neighbors_within_distance(
-                self, MAX_DISTANCE
-            ))
-        return self._neighbours
+        return self.model.households.draws[stage][self.index]
 
     @property
     def perception(self):
@@ -88,7 +115,7 @@ class HouseholdAgent(mg.GeoAgent):
     
     @status.setter
     def status(self, value):
-        if self.status == STATUS_NORMAL and value in [STATUS_EVACUATED, STATUS_DISPLACED]:
+        if self.status == NORMAL and value in (EVACUATED, DISPLACED):
             self.status_changed = True
         else:
             self.status_changed = False 
@@ -100,25 +127,9 @@ class HouseholdAgent(mg.GeoAgent):
         return "Household " + str(self.unique_id)
 
 
-    def get_description(self):        
-        return {
-            'id': self.unique_id,
-            'damage': f"h: {int(100 * self.house_damage)}% - l: {int(100 * self.livelihood_damage)}%",
-            'status': self.status, 
-            'flood_prone': self.flood_prone,
-            'income': f"{self.income:.2f}", 
-            'awareness': f"{int(100 * self.awareness)}%", 
-            'fear': f"{int(100 * self.fear)}%", 
-            'perception': f"{int(100 * self.perception)}%",
-            'trust': f"{int(100 * self.trust)}%", 
-            'received_flood': self.received_flood,
-            'house_materials': self.house_materials,
-            'displacement_time': self.displacement_time,
-            'obstacles_to_movement': self.obstacles_to_movement,
-            'last_house_damage': f"{int(100 * self.last_house_damage)}%",
-            'last_livelihood_damage': f"{int(self.last_livelihood_damage)}%",
-        }
-   
+    def get_description(self):
+        return {'id': self.unique_id, **self.model.households.get_description(self.index)}
+
 
     def init_step(self):
         """
@@ -137,22 +148,22 @@ class HouseholdAgent(mg.GeoAgent):
         """
         check household damage and decide status
         """
-        if self.status in [STATUS_NORMAL, STATUS_TRAPPED]:
+        if self.status in (NORMAL, TRAPPED):
             return
         
-        if self.status == STATUS_EVACUATED:
+        if self.status == EVACUATED:
             selected_threshold = LOW_DAMAGE_THRESHOLD if self.income < POVERTY_LINE else MEDIUM_DAMAGE_THRESHOLD
 
             if self.house_damage < selected_threshold:
-                self.status = STATUS_NORMAL
+                self.status = NORMAL
             else:
-                self.status = STATUS_DISPLACED
+                self.status = DISPLACED
             
-        elif self.status == STATUS_DISPLACED:
+        elif self.status == DISPLACED:
             if self.house_damage < LOW_DAMAGE_THRESHOLD:
-                self.status = STATUS_NORMAL
+                self.status = NORMAL
 
-        if self.status == STATUS_DISPLACED:
+        if self.status == DISPLACED:
             self.displacement_time += 1
         else:
             self.displacement_time = 0
@@ -162,13 +173,13 @@ class HouseholdAgent(mg.GeoAgent):
         """ 
         check household damage and decide status
         """
-        if self.status not in [STATUS_NORMAL, STATUS_TRAPPED]:
+        if self.status not in (NORMAL, TRAPPED):
             # already displaced or evacuated
             return
 
         if self.house_damage > MEDIUM_DAMAGE_THRESHOLD or \
             self.livelihood_damage > MEDIUM_DAMAGE_THRESHOLD:
-            self.status = STATUS_DISPLACED
+            self.status = DISPLACED
             return
 
         if self.house_damage < LOW_DAMAGE_THRESHOLD and \
@@ -181,9 +192,9 @@ class HouseholdAgent(mg.GeoAgent):
     
         if self.income > POVERTY_LINE and \
             not self.obstacles_to_movement:
-                self.status = STATUS_DISPLACED
+                self.status = DISPLACED
         else: # poor household or obstacles to movement
-            self.status = STATUS_TRAPPED
+            self.status = TRAPPED
 
 
     def check_neighbours_for_displacement(self):
@@ -192,21 +203,18 @@ class HouseholdAgent(mg.GeoAgent):
         do this only if household is not already displaced or evacuated.
         Will consider displace if enough neighbours are displaced and can move.
         """    
-        if self.status != STATUS_NORMAL:
+        if self.status != NORMAL:
             return
         
         if self.perception < 0.5:
             return 
         
-        neighbours = self.get_neighbours()
-        
-        other_statuses = [neighbour.status == STATUS_DISPLACED for neighbour in neighbours]
-        if sum(other_statuses) > 0.75 * len(neighbours):
+        if self.count_neighbours('displaced') > 0.75 * self.n_neighbours():
             if self.income < POVERTY_LINE or \
                 self.obstacles_to_movement:
-                self.status = STATUS_TRAPPED
+                self.status = TRAPPED
             else:
-                self.status = STATUS_DISPLACED
+                self.status = DISPLACED
 
 
     def check_for_early_warning(self):
@@ -224,7 +232,7 @@ class HouseholdAgent(mg.GeoAgent):
             # not flood prone, don't receive early warning
             return
         
-        if not self.status in [STATUS_NORMAL, STATUS_TRAPPED]:
+        if not self.status in (NORMAL, TRAPPED):
             # already displaced or evacuated
             # don't receive early warning
             return
@@ -239,7 +247,7 @@ class HouseholdAgent(mg.GeoAgent):
         # prepare for flood anyway
         self.prepared = True
         
-        if self.status == STATUS_TRAPPED:
+        if self.status == TRAPPED:
             # can't evcauate anyway
             return
         
@@ -251,7 +259,7 @@ class HouseholdAgent(mg.GeoAgent):
         # trust the government
         if self.perception >= 0.5:
             # aware of risk, move before flood
-            self.status = STATUS_EVACUATED
+            self.status = EVACUATED
 
 
     def check_neighbours_for_evacuation(self):
@@ -262,23 +270,21 @@ class HouseholdAgent(mg.GeoAgent):
         if not self.model.emitted_early_warning:
             return 
         
-        if self.status not in [STATUS_NORMAL, STATUS_TRAPPED]:
+        if self.status not in (NORMAL, TRAPPED):
             # already evacuated
             return
         
-        neighbours = self.get_neighbours()
+        n_neighbours = self.n_neighbours()
         
-        if self.status != STATUS_TRAPPED:
+        if self.status != TRAPPED:
             # check if other households are evacuated
-            other_status = [neighbour.status == STATUS_EVACUATED for neighbour in neighbours]
-            if sum(other_status) > 0.5 * len(neighbours):
+            if self.count_neighbours('evacuated') > 0.5 * n_neighbours:
                 # enough neighbours are evacuated, evacuate myself if income is high enough
                 if self.income >= POVERTY_LINE and not self.obstacles_to_movement:
-                    self.status = STATUS_EVACUATED
+                    self.status = EVACUATED
     
 
-        other_prepared = [neighbour.prepared for neighbour in neighbours]
-        if sum(other_prepared) > 0.5 * len(neighbours):
+        if self.count_neighbours('prepared') > 0.5 * n_neighbours:
             # enough neighbours are prepared, prepare myself
             self.prepared = True
 
@@ -293,13 +299,13 @@ class HouseholdAgent(mg.GeoAgent):
         if not self.model.flood_event:
             return
         
-        flood_value = self.model.space.get_water_level(self)
+        flood_value = self.model.water_levels[self.index]
 
         if flood_value > 0:
             self.received_flood = True
 
         # house damage using curve        
-        new_damage = get_damage(flood_value, self.house_materials)
+        new_damage = get_damage(flood_value, MATERIALS[self.house_materials])
         self.last_house_damage = new_damage
         self.house_damage = max(self.house_damage, new_damage)
 
@@ -318,15 +324,13 @@ class HouseholdAgent(mg.GeoAgent):
         - if household is not alerted and no one received flood, 
         """
        
-        if self.status not in [STATUS_NORMAL, STATUS_TRAPPED] \
+        if self.status not in (NORMAL, TRAPPED) \
             and not self.status_changed:
             return
         
-        neighbours = self.get_neighbours()
-        neighbours_flooded = [neighbour.received_flood for neighbour in neighbours]
         anyone_flooded = \
             self.received_flood or \
-            any(neighbours_flooded)
+            self.count_neighbours('flooded') > 0
 
         MIN_AWARENESS = 0.5 if self.model.awareness_program else 0.3
         if not anyone_flooded:
@@ -349,12 +353,11 @@ class HouseholdAgent(mg.GeoAgent):
                 self.awareness = np.clip(self.awareness + 0.4, MIN_AWARENESS, 1)
             else:
                 # increase awareness if at least 25% of neighbours have damage over LOW_DAMAGE_THRESHOLD
-                neighbours_high_damage = [neighbour.last_house_damage > LOW_DAMAGE_THRESHOLD for neighbour in neighbours]
-                if sum(neighbours_high_damage) > 0.25 * len(neighbours):
+                if self.count_neighbours('high_damage') > 0.25 * self.n_neighbours():
                     # take into account the near-miss-event effect
                     # [TODO] think about enabling this only if the household is not flooded
 
-                    if random() < self.awareness:  # actually increase awareness with probability higher if already aware
+                    if self.random_draw('update_sentiments') < self.awareness:  # actually increase awareness with probability higher if already aware
                         self.awareness = np.clip(self.awareness + 0.4, MIN_AWARENESS, 1)
                     else: # not aware, decrease awareness because of near-miss-event effect
                         self.awareness = np.clip(self.awareness - 0.1, MIN_AWARENESS, 1)
@@ -382,18 +385,18 @@ class HouseholdAgent(mg.GeoAgent):
         if self.model.house_repair_program > 0:
             # if government help is available, try to use it to fix damage if damage is above MEDIUM_DAMAGE_THRESHOLD
             if self.house_damage > MEDIUM_DAMAGE_THRESHOLD:
-                if random() < self.model.house_repair_program:
+                if self.random_draw('fix_damage') < self.model.house_repair_program:
                     # government help is used to fix damage 100%
                     self.house_damage = 0
 
                     if self.model.house_improvement_program:
                         # if house improvement program is active, house materials are improved
-                        self.house_materials = MATERIAL_CONCRETE
+                        self.house_materials = CONCRETE
 
                     return
         
         if self.income <= POVERTY_LINE\
-            or self.status not in [STATUS_NORMAL, STATUS_TRAPPED]:
+            or self.status not in (NORMAL, TRAPPED):
             # recover only if household is not displaced or evacuated
             # and if household has income above poverty line
             return
@@ -402,11 +405,11 @@ class HouseholdAgent(mg.GeoAgent):
         # every unit of income above poverty line increases recovery by +10%
         recovery = BASE_RICOVERY + (self.income - POVERTY_LINE) / 10
 
-        if self.house_materials in [MATERIAL_CONCRETE, MATERIAL_STONE_BRICKS]:
+        if self.house_materials in (CONCRETE, STONE_BRICKS):
             pass
-        elif self.house_materials in [MATERIAL_MUD_BRICKS, MATERIAL_WOOD]:
+        elif self.house_materials in (MUD_BRICKS, WOOD):
             recovery *= 1.5
-        elif self.house_materials == MATERIAL_INFORMAL_SETTLEMENTS:
+        elif self.house_materials == INFORMAL_SETTLEMENTS:
             recovery *= 2.0
 
         self.house_damage = np.clip(self.house_damage - recovery, 0, 1)
@@ -421,15 +424,15 @@ class HouseholdAgent(mg.GeoAgent):
         if  self.income <= POVERTY_LINE or \
             self.house_damage > LOW_DAMAGE_THRESHOLD or \
             self.received_flood or \
-            self.status not in [STATUS_NORMAL, STATUS_TRAPPED]:
+            self.status not in (NORMAL, TRAPPED):
             return
 
-        neighbours = self.get_neighbours()
+        neighbours = self.model.neighbours.neighbours(self.index)
+        house_damage = self.model.households.house_damage
 
         # help other household to fix damage
-        for neighbour in neighbours:
-            if neighbour.house_damage > 0:
-                neighbour.house_damage = np.clip(neighbour.house_damage - 0.05, 0, 1)
+        damaged = neighbours[house_damage[neighbours] > 0]
+        house_damage[damaged] = np.clip(house_damage[damaged] - 0.05, 0, 1)
    
 
 
@@ -0,0 +1,163 @@
+"""
+Headless batch runner for IGAD parameter sweeps, see README.md for usage.
+Each run is written to <output>/runs/<run_id>.csv as soon as it completes,
+running the same sweep again only runs the missing combinations.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from output import attach_params
+
+
+def get_default_params() -> Dict:
+    """
+    Model parameters used when not set in the grid, same defaults of the server
+    """
+    from utils import SCENARIOS, get_villages
+
+    return dict(
+        save_to_csv=False,
+        stream_output=False,
+        do_early_warning=True,
+        false_alarm_rate=0.3,
+        false_negative_rate=0.1,
+        trust=0.75,
+        house_repair_program=0.0,
+        house_improvement_program=False,
+        basic_income_program=False,
+        awareness_program=False,
+        scenario=SCENARIOS[0],
+        villages=get_villages(),
+    )
+
+
+def expand_grid(grid: Dict) -> List[Dict]:
+    """
+    Returns all the combinations of the parameters values,
+    a value which is not a list is used for all the runs
+    """
+    names = list(grid.keys())
+    values = [
+        grid[name] if isinstance(grid[name], list) else [grid[name]]
+        for name in names
+    ]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def get_run_id(params: Dict, seed: int) -> str:
+    key = json.dumps(params, sort_keys=True) + f'#{seed}'
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def get_seed(seed: int, replicate: int) -> int:
+    """
+    Seed of a replicate, the same for every parameter combination.
+    Replicates use independent streams spawned from the sweep seed
+    """
+    child = np.random.SeedSequence(seed).spawn(replicate + 1)[replicate]
+    return int(child.generate_state(1, np.uint64)[0])
+
+
+def run_model(params: Dict, seed: int, output_dir: str = None) -> pd.DataFrame:
+    """
+    Run a model for MAX_YEARS steps without the web server
+    Returns the model variables dataframe,
+    agent variables are streamed to output_dir if given
+    """
+    from model import IGAD
+    from utils import MAX_YEARS
+
+    model = IGAD(**{**get_default_params(), **params}, seed=seed, output_dir=output_dir)
+    try:
+        for _ in range(MAX_YEARS):
+            model.step()
+    finally:
+        model.close()
+
+    df_model = model.datacollector.get_model_vars_dataframe()
+    df_model.index.name = 'step'
+    return df_model
+
+
+def run_and_save(output: str, run_id: str, replicate: int, seed: int, params: Dict, agents: bool = False) -> str:
+    """
+    Run a single model of the sweep and write its results,
+    the model variables file is written last and marks the run as completed.
+    Agent variables are streamed to <output>/runs/<run_id>_agents, see output.read_run
+    """
+    output_dir = os.path.join(output, 'runs', f'{run_id}_agents') if agents else None
+    df_model = run_model(params, seed, output_dir)
+
+    path = os.path.join(output, 'runs', f'{run_id}.csv')
+    tmp_path = f'{path}.tmp'
+    attach_params(df_model, params, run_id=run_id, replicate=replicate, seed=seed).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_sweep(grid: Dict, replicates: int, output: str, seed: int = 0, workers: int = None, agents: bool = False) -> pd.DataFrame:
+    """
+    Run all the combinations of the grid for the given number of replicates.
+    Runs already in the output directory are skipped.
+    Returns the model variables of all the runs in a single dataframe,
+    also written to <output>/results.csv
+    """
+    os.makedirs(os.path.join(output, 'runs'), exist_ok=True)
+    with open(os.path.join(output, 'sweep.json'), 'w') as f:
+        json.dump(dict(grid=grid, replicates=replicates, seed=seed), f, indent=4)
+
+    runs = []
+    for params in expand_grid(grid):
+        for replicate in range(replicates):
+            run_seed = get_seed(seed, replicate)
+            runs.append((get_run_id(params, run_seed), replicate, run_seed, params))
+
+    pending = [
+        run for run in runs
+        if not os.path.exists(os.path.join(output, 'runs', f'{run[0]}.csv'))
+    ]
+    print(f'{len(runs)} runs, {len(runs) - len(pending)} already completed')
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {
+            executor.submit(run_and_save, output, run_id, replicate, run_seed, params, agents): run_id
+            for run_id, replicate, run_seed, params in pending
+        }
+        for n, future in enumerate(as_completed(futures), 1):
+            future.result()
+            print(f'[{n}/{len(pending)}] run {futures[future]} completed')
+
+    df = pd.concat([
+        pd.read_csv(os.path.join(output, 'runs', f'{run_id}.csv'))
+        for run_id, _, _, _ in runs
+    ], ignore_index=True)
+    df.to_csv(os.path.join(output, 'results.csv'), index=False)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a parameter sweep of the IGAD model')
+    parser.add_argument('grid', help='JSON file with the list of values of each parameter')
+    parser.add_argument('--replicates', type=int, default=1, help='number of runs for each combination')
+    parser.add_argument('--output', default='output/sweep', help='output directory, used to resume a sweep')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the sweep, replicates seeds are spawned from it')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes, default all cores')
+    parser.add_argument('--agents', action='store_true', help='also stream the agent variables of each run')
+    args = parser.parse_args()
+
+    with open(args.grid) as f:
+        grid = json.load(f)
+
+    run_sweep(grid, args.replicates, args.output, seed=args.seed, workers=args.workers, agents=args.agents)
+
+
+if __name__ == '__main__':
+    main()
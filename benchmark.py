@@ -0,0 +1,212 @@
+"""
+Offline benchmark of the IGAD model on synthetic datasets, see README.md for usage.
+For every number of households and engine, a separate process times the model
+construction, each stage of STAGE_LIST, the flood update, the data collection
+and a full run of MAX_YEARS steps, and records its peak memory.
+Results are written as JSON, and two results files can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+ENGINES = ['vectorized', 'agents']
+SIZES = [1000, 10000, 100000]
+SCENARIO = 'Extreme Hazard'
+
+
+def get_model_params(engine: str) -> Dict:
+    """
+    Model parameters of the benchmark, all the programs are active
+    """
+    from utils import get_villages
+
+    return dict(
+        villages=get_villages(),
+        scenario=SCENARIO,
+        seed=0,
+        vectorized=engine == 'vectorized',
+        do_early_warning=True,
+        false_alarm_rate=0.3,
+        false_negative_rate=0.1,
+        trust=0.75,
+        house_repair_program=0.3,
+        house_improvement_program=True,
+        basic_income_program=False,
+        awareness_program=True,
+    )
+
+
+def benchmark_model(engine: str) -> Dict:
+    """
+    Benchmark a model with the dataset of IGAD_DATA_DIR in the current process.
+    Construction is timed twice, with empty and full caches.
+    """
+    from model import IGAD
+    from utils import MAX_YEARS
+
+    params = get_model_params(engine)
+
+    start = time.perf_counter()
+    IGAD(**params)
+    init_cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = IGAD(**params)
+    init = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(MAX_YEARS):
+        model.step()
+    run = time.perf_counter() - start
+
+    # second run with every part of the step measured by the model profiler
+    model = IGAD(**params, profile=True)
+    for _ in range(MAX_YEARS):
+        model.step()
+        # the raster layer is read lazily, as the visualization would
+        model.space.raster_layer.water_level
+    summary = model.profiler.summary()
+    timings = summary['time_per_step'].to_dict()
+
+    return dict(
+        engine=engine,
+        households=len(model.agents),
+        steps=MAX_YEARS,
+        init_cold=init_cold,
+        init=init,
+        run=run,
+        step=run / MAX_YEARS,
+        stages={stage: timings.get(f'stage.{stage}', 0.0) for stage in model.schedule.stage_list},
+        update_water_level=timings.get('update_flood', 0.0) + timings.get('read_water_level', 0.0),
+        collect=timings.get('collect', 0.0),
+        # ru_maxrss is in kilobytes on linux
+        peak_memory_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    )
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_benchmarks(sizes: List[int], engines: List[str], data_dir: str, max_agents_size: int) -> Dict:
+    """
+    Run the benchmark of every engine for every size in a separate process,
+    generating the synthetic datasets in data_dir if needed
+    """
+    from synthetic import generate
+
+    results = []
+    for size in sizes:
+        path = os.path.join(data_dir, f'households_{size}')
+        if not os.path.exists(path):
+            print(f'Generating dataset with {size} households')
+            generate(path, n_villages=max(1, size // 1000), n_households=size)
+
+        for engine in engines:
+            if engine == 'agents' and size > max_agents_size:
+                continue
+            print(f'Benchmark {engine} engine with {size} households')
+            cache_dir = os.path.join(path, 'cache', engine)
+            result_file = os.path.join(path, f'result_{engine}.json')
+            for filename in os.listdir(cache_dir) if os.path.exists(cache_dir) else []:
+                os.remove(os.path.join(cache_dir, filename))
+
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', engine, result_file],
+                env={**os.environ, 'IGAD_DATA_DIR': path, 'IGAD_CACHE_DIR': cache_dir},
+                stdout=subprocess.DEVNULL, check=True
+            )
+            with open(result_file) as f:
+                results.append(json.load(f))
+
+    return dict(
+        commit=get_commit(),
+        date=datetime.now().isoformat(timespec='seconds'),
+        python=platform.python_version(),
+        machine=platform.machine(),
+        cpu_count=os.cpu_count(),
+        results=results,
+    )
+
+
+def flatten(result: Dict) -> Dict[str, float]:
+    """
+    Timings and memory of a result as a flat dictionary
+    """
+    values = {
+        name: value for name, value in result.items()
+        if name not in ('engine', 'households', 'steps', 'stages')
+    }
+    values.update({f'stage.{stage}': value for stage, value in result['stages'].items()})
+    return values
+
+
+def compare(old_file: str, new_file: str):
+    """
+    Print the ratio new / old of every measure of the results with the same engine and size
+    """
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+
+    old_results = {(result['engine'], result['households']): result for result in old['results']}
+    print(f"{'engine':<12}{'households':>12}  {'measure':<45}{old['commit']:>12}{new['commit']:>12}{'ratio':>8}")
+    for result in new['results']:
+        key = (result['engine'], result['households'])
+        if key not in old_results:
+            continue
+        old_values = flatten(old_results[key])
+        for name, value in flatten(result).items():
+            old_value = old_values.get(name)
+            if old_value is None:
+                continue
+            ratio = value / old_value if old_value else float('nan')
+            print(f'{key[0]:<12}{key[1]:>12}  {name:<45}{old_value:>12.4f}{value:>12.4f}{ratio:>8.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the IGAD model on synthetic datasets')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of households')
+    parser.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES, help='engines to benchmark')
+    parser.add_argument('--max-agents-size', type=int, default=10000,
+                        help='largest number of households for the agents engine')
+    parser.add_argument('--data-dir', default='benchmark_data', help='directory of the synthetic datasets')
+    parser.add_argument('--output', default=None, help='results file, default output/benchmark_<commit>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files')
+    parser.add_argument('--child', nargs=2, metavar=('ENGINE', 'RESULT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.child:
+        engine, result_file = args.child
+        with open(result_file, 'w') as f:
+            json.dump(benchmark_model(engine), f, indent=4)
+        return
+
+    results = run_benchmarks(args.sizes, args.engines, args.data_dir, args.max_agents_size)
+    output = args.output or os.path.join('output', f"benchmark_{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f'Results written to {output}')
+
+
+if __name__ == '__main__':
+    main()
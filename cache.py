@@ -0,0 +1,111 @@
+import glob
+import hashlib
+import os
+import pickle
+
+import numpy as np
+
+# directory for the preprocessed data, can be overridden by environment
+CACHE_DIR = os.environ.get('IGAD_CACHE_DIR', 'cache')
+
+
+def get_key(*values) -> str:
+    """
+    Returns a short hash identifying a list of values (strings, numbers or arrays)
+    """
+    digest = hashlib.sha1()
+    for value in values:
+        if isinstance(value, np.ndarray):
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value).encode())
+    return digest.hexdigest()[:16]
+
+
+def get_file_key(*filenames: str) -> str:
+    """
+    Returns a short hash of the content of the given files,
+    including the sidecar files of a shapefile (same name, any extension)
+    """
+    digest = hashlib.sha1()
+    for filename in filenames:
+        for path in sorted(glob.glob(glob.escape(os.path.splitext(filename)[0]) + '.*')):
+            digest.update(os.path.basename(path).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def get_cache_path(name: str, key: str, extension: str = 'npz') -> str:
+    """
+    Returns the path of a cache file, creating the cache directory if needed
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, f'{name}_{key}.{extension}')
+
+
+def load_arrays(path: str, checksum: str = None) -> dict | None:
+    """
+    Load arrays saved with save_arrays.
+    Returns None if the file doesn't exist or it was saved with a different checksum
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        arrays = dict(data)
+    if checksum is not None and str(arrays.pop('checksum', '')) != checksum:
+        return None
+    arrays.pop('checksum', None)
+    return arrays
+
+
+def save_arrays(path: str, checksum: str = None, **arrays):
+    """
+    Save arrays to path, writing to a temporary file first
+    so that concurrent processes never read a partial file
+    """
+    if checksum is not None:
+        arrays['checksum'] = np.array(checksum)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_object(path: str, checksum: str):
+    """
+    Load an object (e.g. a DataFrame) saved with save_object.
+    Returns None if the file doesn't exist or it was saved with a different checksum
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        saved_checksum, obj = pickle.load(f)
+    if saved_checksum != checksum:
+        return None
+    return obj
+
+
+def save_object(path: str, checksum: str, obj):
+    """
+    Save an object to path with its checksum, writing to a temporary file first
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump((checksum, obj), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_cached(name: str, filenames: list, build):
+    """
+    Returns the object built by build() from the given source files,
+    cached on disk and rebuilt when the content of any of the files changes
+    """
+    path = get_cache_path(name, get_key(*filenames), 'pkl')
+    checksum = get_file_key(*filenames)
+
+    obj = load_object(path, checksum)
+    if obj is None:
+        obj = build()
+        save_object(path, checksum, obj)
+    return obj
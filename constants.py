@@ -1,3 +1,4 @@
+from enum import IntEnum
 
 # Poverty line 
 POVERTY_LINE = 1
@@ -12,6 +13,10 @@ FLOOD_FEAR_MAX = 300
 
 DISPLACE_DAMAGE_THRESHOLD = 0.65
 
+LOW_DAMAGE_THRESHOLD = 0.25
+MEDIUM_DAMAGE_THRESHOLD = 0.70
+BASE_RICOVERY = 0.30
+
 
 STATUS_NORMAL = 'normal'
 STATUS_EVACUATED = 'evacuated'
@@ -24,3 +29,23 @@ MATERIAL_WOOD = 'Wood'
 MATERIAL_MUD_BRICKS = 'Mud bricks'
 MATERIAL_INFORMAL_SETTLEMENTS = 'Informal settlement'
 
+
+# integer codes used by the array-backed household state,
+# names are only used for output: STATUSES[code], MATERIALS[code]
+STATUSES = [STATUS_NORMAL, STATUS_EVACUATED, STATUS_DISPLACED, STATUS_TRAPPED]
+MATERIALS = [MATERIAL_STONE_BRICKS, MATERIAL_CONCRETE, MATERIAL_WOOD, MATERIAL_MUD_BRICKS, MATERIAL_INFORMAL_SETTLEMENTS]
+
+
+class Status(IntEnum):
+    NORMAL = STATUSES.index(STATUS_NORMAL)
+    EVACUATED = STATUSES.index(STATUS_EVACUATED)
+    DISPLACED = STATUSES.index(STATUS_DISPLACED)
+    TRAPPED = STATUSES.index(STATUS_TRAPPED)
+
+
+class Material(IntEnum):
+    STONE_BRICKS = MATERIALS.index(MATERIAL_STONE_BRICKS)
+    CONCRETE = MATERIALS.index(MATERIAL_CONCRETE)
+    WOOD = MATERIALS.index(MATERIAL_WOOD)
+    MUD_BRICKS = MATERIALS.index(MATERIAL_MUD_BRICKS)
+    INFORMAL_SETTLEMENTS = MATERIALS.index(MATERIAL_INFORMAL_SETTLEMENTS)
@@ -0,0 +1,157 @@
+"""
+Data not depending on the model parameters, built once and shared by the models
+created with the same villages (and seed), e.g. at every reset of the web interface.
+Arrays are read-only: models copy them in their own Households arrays.
+"""
+from functools import lru_cache
+from typing import List, Tuple
+
+import numpy as np
+import shapely
+
+from constants import MATERIALS, MAX_DISTANCE
+from hazard import HazardTable, get_hazard_table
+from neighbours import NeighbourGraph, get_neighbour_graph
+from spaces import IGADSpace
+from utils import get_incomes, get_population_data, get_settlement_assignment, MAPS_BASENAME
+
+# number of population samples kept in memory, one for each villages and seed
+POPULATION_CACHE_SIZE = 16
+
+
+def read_only(*arrays: np.ndarray):
+    for array in arrays:
+        array.flags.writeable = False
+
+
+class VillagesContext:
+    """
+    Households of a set of villages: positions, geometries,
+    neighbour graph and water level on every hazard map
+    """
+
+    def __init__(
+        self,
+        villages: Tuple[str, ...],
+        positions: List[tuple],
+        flood_prones: np.ndarray,
+        neighbours: NeighbourGraph,
+        hazard: HazardTable,
+    ):
+        self.villages = villages
+        self.positions = positions
+        self.flood_prones = flood_prones
+        # shapely geometries are immutable, agents of every model share them
+        self.geometries = list(shapely.points(np.array(positions, dtype=np.float64).reshape(-1, 2)))
+        self.neighbours = neighbours
+        self.hazard = hazard
+        read_only(flood_prones, neighbours.offsets, neighbours.indices, neighbours.rows, hazard.depths)
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class PopulationSample:
+    """
+    Attributes of the households of a set of villages sampled from the population data,
+    with the state of the random number generator after sampling
+    """
+
+    def __init__(
+        self,
+        incomes: np.ndarray,
+        awarenesses: np.ndarray,
+        fears: np.ndarray,
+        house_materials: np.ndarray,
+        households_size: np.ndarray,
+        obstacles_to_movement: np.ndarray,
+        rng_state: dict,
+    ):
+        self.incomes = incomes
+        self.awarenesses = awarenesses
+        self.fears = fears
+        # index in MATERIALS
+        self.house_materials = house_materials
+        self.households_size = households_size
+        self.obstacles_to_movement = obstacles_to_movement
+        self.rng_state = rng_state
+        read_only(incomes, awarenesses, fears, house_materials, households_size, obstacles_to_movement)
+
+
+def get_village_boxes(villages: Tuple[str, ...]) -> List[Tuple[str, int, int, int]]:
+    """
+    (village, box, start, end) of every bounding box of the given villages,
+    its settlements are the rows start:end of the settlement assignment
+    """
+    assignment = get_settlement_assignment()
+    # settlements of bounding box b are the rows box_start[b]:box_start[b+1] of the assignment
+    box_start = np.searchsorted(assignment['box'], np.arange(len(assignment['box_village']) + 1))
+    return [
+        (village, box, box_start[box], box_start[box + 1])
+        for village in villages
+        for box in np.flatnonzero(assignment['box_village'] == village)
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_villages_context(villages: Tuple[str, ...]) -> VillagesContext:
+    """
+    Returns the context of the given villages, built on first use
+    """
+    for village in villages:
+        print('Loading data for village', village)
+    assignment = get_settlement_assignment()
+    positions = []
+    flood_prones = []
+    for village, box, start, end in get_village_boxes(villages):
+        positions += list(zip(assignment['x'][start:end], assignment['y'][start:end]))
+        flood_prones += [assignment['box_flood_prone'][box]] * (end - start)
+
+    # neighbours within MAX_DISTANCE of every household
+    neighbours = get_neighbour_graph(list(villages), positions, MAX_DISTANCE)
+
+    # water level of every household on every return period map
+    space = IGADSpace(crs='epsg:4326', warn_crs_conversion=False, reference=f'{MAPS_BASENAME}_0001_cut.tif')
+    xs, ys = np.array(positions, dtype=np.float64).reshape(-1, 2).T
+    rows, cols = space.get_raster_indices(space.get_positions(xs, ys))
+    hazard = get_hazard_table(list(villages), rows, cols)
+
+    return VillagesContext(villages, positions, np.array(flood_prones, dtype=bool), neighbours, hazard)
+
+
+def sample_population(villages: Tuple[str, ...], rng: np.random.Generator) -> PopulationSample:
+    """
+    Sample the attributes of the households of the given villages from the population data
+    """
+    all_population_data = get_population_data()
+    samples = []
+    incomes = []
+    for village, _, start, end in get_village_boxes(villages):
+        population_data = all_population_data.query('village == @village')
+        village_data = population_data.sample(end - start, replace=True, random_state=rng)
+        incomes.append(get_incomes(village_data['income'].values, rng))
+        samples.append(village_data)
+
+    def column(name, dtype):
+        return np.concatenate([np.empty(0, dtype=dtype)] + [sample[name].values.astype(dtype) for sample in samples])
+
+    return PopulationSample(
+        incomes=np.concatenate([np.empty(0)] + incomes),
+        awarenesses=column('awareness', np.float64),
+        fears=column('fear_of_flood', np.float64),
+        house_materials=np.array([
+            MATERIALS.index(material)
+            for sample in samples for material in sample['walls_materials'].values
+        ], dtype=np.int64),
+        households_size=column('household_size', np.float64),
+        obstacles_to_movement=column('obstacles_to_movement', bool),
+        rng_state=rng.bit_generator.state,
+    )
+
+
+@lru_cache(maxsize=POPULATION_CACHE_SIZE)
+def get_population_sample(villages: Tuple[str, ...], seed: int) -> PopulationSample:
+    """
+    Returns the population sample of the given villages for a model created with seed
+    """
+    return sample_population(villages, np.random.default_rng(seed))
@@ -0,0 +1,70 @@
+import glob
+import os
+from typing import List
+
+import numpy as np
+import rasterio as rio
+
+from cache import get_cache_path, get_key, load_arrays, save_arrays
+from utils import MAPS_BASENAME
+
+
+class HazardTable:
+    """
+    Water level of every household (columns) for every hazard map (rows)
+    """
+
+    def __init__(self, filenames: List[str], depths: np.ndarray):
+        self.filenames = list(filenames)
+        self.depths = depths
+        self._rows = {filename: row for row, filename in enumerate(self.filenames)}
+
+    def get_water_levels(self, event_files: List[str]) -> np.ndarray:
+        """
+        water level of every household, maximum of the given event maps
+        """
+        rows = [self._rows[event_file] for event_file in event_files]
+        return self.depths[rows].max(axis=0)
+
+    def get_dry(self) -> np.ndarray:
+        """
+        water level of every household when there are no events
+        """
+        return np.zeros(self.depths.shape[1], dtype=self.depths.dtype)
+
+
+def get_hazard_maps() -> List[str]:
+    """
+    Returns the filenames of all the return period maps
+    """
+    return sorted(glob.glob(f'{MAPS_BASENAME}_*_cut.tif'))
+
+
+def get_hazard_table(villages: List[str], rows: np.ndarray, cols: np.ndarray) -> HazardTable:
+    """
+    Sample every return period map at the given raster indices.
+    The table is cached on disk by maps and village set,
+    and it is rebuilt if the indices or any of the maps change.
+    """
+    filenames = get_hazard_maps()
+    path = get_cache_path('hazard', get_key(MAPS_BASENAME, villages))
+    checksum = get_key(
+        rows, cols,
+        [(filename, os.path.getmtime(filename), os.path.getsize(filename)) for filename in filenames]
+    )
+
+    arrays = load_arrays(path, checksum)
+    if arrays is not None:
+        return HazardTable(filenames, arrays['depths'])
+
+    samples = []
+    for filename in filenames:
+        with rio.open(filename) as f:
+            samples.append(f.read(1)[rows, cols])
+    if samples:
+        depths = np.stack(samples)
+    else:
+        depths = np.zeros((0, len(rows)))
+
+    save_arrays(path, checksum, depths=depths)
+    return HazardTable(filenames, depths)
@@ -0,0 +1,644 @@
+import numpy as np
+
+from utils import get_damages
+from constants import (BASE_RICOVERY, FLOOD_DAMAGE_MAX, LOW_DAMAGE_THRESHOLD,
+                       MEDIUM_DAMAGE_THRESHOLD, POVERTY_LINE)
+from constants import STATUSES, MATERIALS, Status, Material
+
+
+# codes as plain int, faster than the enums in numpy operations
+NORMAL = int(Status.NORMAL)
+EVACUATED = int(Status.EVACUATED)
+DISPLACED = int(Status.DISPLACED)
+TRAPPED = int(Status.TRAPPED)
+STONE_BRICKS = int(Material.STONE_BRICKS)
+CONCRETE = int(Material.CONCRETE)
+WOOD = int(Material.WOOD)
+MUD_BRICKS = int(Material.MUD_BRICKS)
+INFORMAL_SETTLEMENTS = int(Material.INFORMAL_SETTLEMENTS)
+
+# house recovery multiplier for each material code
+RECOVERY_FACTORS = np.ones(len(MATERIALS))
+RECOVERY_FACTORS[MUD_BRICKS] = 1.5
+RECOVERY_FACTORS[WOOD] = 1.5
+RECOVERY_FACTORS[INFORMAL_SETTLEMENTS] = 2.0
+
+# stages using random numbers, a block of draws for every household is made at each step
+RANDOM_STAGES = ['update_sentiments', 'fix_damage']
+
+# stages doing nothing in a quiescent year, without flood event and early warning
+QUIESCENT_NOOP_STAGES = ['check_for_early_warning', 'check_neighbours_for_evacuation', 'react_to_flood']
+# stages depending only on the state of each household, run by the kernels in a quiescent year
+QUIESCENT_KERNEL_STAGES = ['init_step', 'return_decision', 'displacement_decision', 'fix_damage']
+
+# neighbour counters maintained by Households.track_neighbours:
+# name -> (field, condition on the field value)
+NEIGHBOUR_COUNTERS = {
+    'displaced': ('status', lambda status: status == DISPLACED),
+    'evacuated': ('status', lambda status: status == EVACUATED),
+    'prepared': ('prepared', lambda prepared: prepared),
+    'flooded': ('received_flood', lambda received_flood: received_flood),
+    'high_damage': ('last_house_damage', lambda damage: damage > LOW_DAMAGE_THRESHOLD),
+}
+
+# neighbour counts read by the kernel of each stage, see Households.get_neighbour_snapshot.
+# helpers is the number of households helping each household in fix_neighbours_damage
+STAGE_NEIGHBOUR_COUNTS = {
+    'check_neighbours_for_evacuation': ['evacuated', 'prepared'],
+    'check_neighbours_for_displacement': ['displaced'],
+    'update_sentiments': ['flooded', 'high_damage'],
+    'fix_neighbours_damage': ['helpers'],
+}
+
+# model statistics returned by Households.get_statistics
+STATISTICS = [
+    "n_displaced", "n_normal", "n_evacuated", "n_trapped",
+    "mean_house_damage", "mean_livelihood_damage", "mean_trust", "mean_perception",
+    "mean_income", "mean_awareness", "mean_fear",
+    "displaced_lte_2", "displaced_lte_5", "displaced_gt_5",
+    "n_flooded", "affected_population",
+]
+
+# household attributes and their array dtype, all initialized to 0 / False
+FIELDS = {
+    # population data
+    'base_income': np.float64,
+    'flood_prone': np.bool_,
+    'household_size': np.int64,
+    'house_materials': np.int8,
+    'obstacles_to_movement': np.bool_,
+    # sentiments
+    'awareness': np.float64,
+    'fear': np.float64,
+    'trust': np.float64,
+    # state
+    'status': np.int8,
+    'status_changed': np.bool_,
+    'house_damage': np.float64,
+    'livelihood_damage': np.float64,
+    'displacement_time': np.int64,
+    # per step flags
+    'alerted': np.bool_,
+    'prepared': np.bool_,
+    'received_flood': np.bool_,
+    'last_house_damage': np.float64,
+    'last_livelihood_damage': np.float64,
+}
+
+
+class HouseholdField:
+    """
+    Attribute of a HouseholdAgent backed by the model Households arrays.
+    Status and house materials are integer codes (Status, Material).
+    """
+
+    def __init__(self, field=None):
+        self.field = field
+
+    def __set_name__(self, owner, name):
+        if self.field is None:
+            self.field = name
+
+    def __get__(self, agent, owner=None):
+        if agent is None:
+            return self
+        return getattr(agent.model.households, self.field)[agent.index].item()
+
+    def __set__(self, agent, value):
+        households = agent.model.households
+        values = getattr(households, self.field)
+        if households.neighbour_counts is not None and self.field in households.counted_fields:
+            old_value = values[agent.index]
+            values[agent.index] = value
+            if values[agent.index] != old_value:
+                households.update_neighbour_counts(self.field, agent.index, old_value, values[agent.index])
+        else:
+            values[agent.index] = value
+
+
+class Households:
+    """
+    State of all the households of a model, stored as one array per attribute.
+    HouseholdAgent instances are views on a single index of these arrays.
+
+    Every stage of STAGE_LIST is also implemented here as a vectorized kernel
+    with the same rules of the HouseholdAgent method with the same name.
+    Kernels update all the households at once: stages reading the neighbours
+    (check_neighbours_for_displacement, check_neighbours_for_evacuation,
+    fix_neighbours_damage) see the state at the beginning of the stage,
+    while HouseholdAgent methods see the changes of the households
+    activated before them.
+
+    A view on a chunk of the households (see view) runs the kernels on its chunk only,
+    reading the neighbours from a snapshot of the state at the beginning of the stage.
+    """
+
+    def __init__(self, model, n_households):
+        """
+        Create the arrays for n_households households
+        :param model:           Model the households belong to
+        :param n_households:    Number of households
+        """
+        self.model = model
+        for name, dtype in FIELDS.items():
+            setattr(self, name, np.zeros(n_households, dtype=dtype))
+        self.status[:] = NORMAL
+        self.draws = {}
+        # counters of the neighbours of each household, see track_neighbours
+        self.neighbour_counts = None
+        # counters not updated by the kernels run in a quiescent year, see refresh_neighbour_counts
+        self._stale_counts = False
+        self.counted_fields = {field for field, _ in NEIGHBOUR_COUNTERS.values()}
+        # field -> [(counter name, condition)]
+        self._field_counters = {field: [] for field in self.counted_fields}
+        for name, (field, condition) in NEIGHBOUR_COUNTERS.items():
+            self._field_counters[field].append((name, condition))
+        self._cell_positions = None
+        # households of a view and neighbour counts at the beginning of the stage
+        self._chunk = slice(None)
+        self._snapshot = None
+
+    def view(self, chunk, snapshot):
+        """
+        Households sharing the arrays of the households in chunk,
+        kernels of the view write only these households
+        :param chunk:       slice of the households
+        :param snapshot:    neighbour counts of all the households, see get_neighbour_snapshot
+        """
+        view = object.__new__(Households)
+        view.__dict__.update(self.__dict__)
+        for name in FIELDS:
+            setattr(view, name, getattr(self, name)[chunk])
+        view.draws = {stage: draws[chunk] for stage, draws in self.draws.items()}
+        view.neighbour_counts = None
+        view._chunk = chunk
+        view._snapshot = snapshot
+        return view
+
+    def __len__(self):
+        return len(self.status)
+
+    @property
+    def perception(self):
+        return self.awareness * self.fear
+
+    @property
+    def income(self):
+        """
+        household income:
+        livelihood and basic income if applicable
+        """
+        basic_income = 0
+        if self.model.basic_income_program:
+            basic_income = POVERTY_LINE
+
+        return self.base_income * (1 - self.livelihood_damage) + basic_income
+
+    def copy(self):
+        """
+        Households with a copy of the arrays, e.g. to keep the state of a step
+        """
+        households = object.__new__(Households)
+        households.__dict__.update(self.__dict__)
+        for name in FIELDS:
+            setattr(households, name, getattr(self, name).copy())
+        households.draws = {}
+        households.neighbour_counts = None
+        return households
+
+    def get_description(self, index):
+        """
+        attributes of household index shown in the map popups
+        """
+        values = {name: getattr(self, name)[index].item() for name in FIELDS}
+        basic_income = 0
+        if self.model.basic_income_program:
+            basic_income = POVERTY_LINE
+        income = values['base_income'] * (1 - values['livelihood_damage']) + basic_income
+        perception = values['awareness'] * values['fear']
+
+        return {
+            'damage': f"h: {int(100 * values['house_damage'])}% - l: {int(100 * values['livelihood_damage'])}%",
+            'status': STATUSES[values['status']],
+            'flood_prone': values['flood_prone'],
+            'income': f"{income:.2f}",
+            'awareness': f"{int(100 * values['awareness'])}%",
+            'fear': f"{int(100 * values['fear'])}%",
+            'perception': f"{int(100 * perception)}%",
+            'trust': f"{int(100 * values['trust'])}%",
+            'received_flood': values['received_flood'],
+            'house_materials': MATERIALS[values['house_materials']],
+            'displacement_time': values['displacement_time'],
+            'obstacles_to_movement': values['obstacles_to_movement'],
+            'last_house_damage': f"{int(100 * values['last_house_damage'])}%",
+            'last_livelihood_damage': f"{int(values['last_livelihood_damage'])}%",
+        }
+
+    def draw_random(self, rng):
+        """
+        draw the random numbers of every stage in RANDOM_STAGES for the next step,
+        household i uses draws[stage][i] both in the HouseholdAgent method and in the kernel
+        """
+        for stage in RANDOM_STAGES:
+            self.draws[stage] = rng.random(len(self))
+
+    def normal_or_trapped(self):
+        return (self.status == NORMAL) | (self.status == TRAPPED)
+
+    def set_status(self, mask, status):
+        """
+        set status code for the masked households,
+        keeping track of status changes from normal as HouseholdAgent.status
+        """
+        self.status_changed[mask] = \
+            (self.status[mask] == NORMAL) & (status in (EVACUATED, DISPLACED))
+        self.status[mask] = status
+
+    def get_cell_positions(self):
+        """
+        positions of the raster cells containing each household
+        """
+        if self._cell_positions is None:
+            xs, ys = np.array(self.model.positions, dtype=np.float64).reshape(-1, 2).T
+            self._cell_positions = self.model.space.get_positions(xs, ys)
+        return self._cell_positions
+
+    @property
+    def water_levels(self):
+        return self.model.water_levels[self._chunk]
+
+    def n_neighbours(self):
+        return self.model.neighbours.degree()[self._chunk]
+
+    def count_neighbours(self, mask):
+        """
+        number of neighbours of each household for which mask is True
+        """
+        return self.model.neighbours.count(mask)
+
+    def helping(self):
+        """
+        households helping their neighbours to fix damage
+        """
+        return (self.income > POVERTY_LINE) & \
+            (self.house_damage <= LOW_DAMAGE_THRESHOLD) & \
+            ~self.received_flood & \
+            self.normal_or_trapped()
+
+    def get_neighbour_count(self, name):
+        """
+        neighbour count read by the kernels, from the snapshot in a view:
+        one of NEIGHBOUR_COUNTERS or helpers
+        """
+        if self._snapshot is not None:
+            return self._snapshot[name][self._chunk]
+        if name == 'helpers':
+            # number of helping households having each household as neighbour
+            return self.model.neighbours.count_as_neighbour(self.helping())
+        field, condition = NEIGHBOUR_COUNTERS[name]
+        return self.count_neighbours(condition(getattr(self, field)))
+
+    def get_neighbour_snapshot(self, stage):
+        """
+        neighbour counts read by the kernel of the given stage,
+        computed on all the households before running it on views
+        """
+        return {name: self.get_neighbour_count(name) for name in STAGE_NEIGHBOUR_COUNTS.get(stage, [])}
+
+    def get_eligible(self, stage):
+        """
+        households which can be affected by the HouseholdAgent method of the given stage,
+        as a boolean mask, or None for all the households.
+        Conditions only depend on the state of the household that other households
+        can't change during the stage, so the agents not selected would return immediately.
+        """
+        if stage == 'return_decision':
+            return (self.status == EVACUATED) | (self.status == DISPLACED)
+
+        if stage == 'check_for_early_warning':
+            if not self.model.emitted_early_warning:
+                return np.zeros(len(self), dtype=bool)
+            return self.flood_prone & self.normal_or_trapped()
+
+        if stage == 'check_neighbours_for_evacuation':
+            if not self.model.emitted_early_warning:
+                return np.zeros(len(self), dtype=bool)
+            return self.normal_or_trapped()
+
+        if stage == 'react_to_flood':
+            if not self.model.flood_event:
+                return np.zeros(len(self), dtype=bool)
+            return None
+
+        if stage == 'displacement_decision':
+            return self.normal_or_trapped()
+
+        if stage == 'check_neighbours_for_displacement':
+            return (self.status == NORMAL) & (self.perception >= 0.5)
+
+        if stage == 'update_sentiments':
+            return self.normal_or_trapped() | self.status_changed
+
+        if stage == 'fix_neighbours_damage':
+            # house damage is not checked: it can be reduced by the neighbours in this stage
+            return (self.income > POVERTY_LINE) & ~self.received_flood & self.normal_or_trapped()
+
+        # init_step, fix_damage
+        return None
+
+    def get_statistics(self):
+        """
+        model statistics reported by the datacollector, computed in one pass over the arrays
+        """
+        counts = np.bincount(self.status, minlength=len(STATUSES))
+        flooded_size = self.household_size[self.received_flood]
+        affected = self.normal_or_trapped()[self.received_flood]
+        displacement_time = self.displacement_time
+
+        return {
+            "n_displaced": int(counts[DISPLACED]),
+            "n_normal": int(counts[NORMAL]),
+            "n_evacuated": int(counts[EVACUATED]),
+            "n_trapped": int(counts[TRAPPED]),
+
+            "mean_house_damage": np.mean(self.house_damage) * 100,
+            "mean_livelihood_damage": np.mean(self.livelihood_damage) * 100,
+            "mean_trust": np.mean(self.trust) * 100,
+            "mean_perception": np.mean(self.perception) * 100,
+            "mean_income": np.mean(self.income) * 100,
+            "mean_awareness": np.mean(self.awareness) * 100,
+            "mean_fear": np.mean(self.fear) * 100,
+            "displaced_lte_2": int(np.count_nonzero((1 <= displacement_time) & (displacement_time <= 2))),
+            "displaced_lte_5": int(np.count_nonzero((2 < displacement_time) & (displacement_time <= 5))),
+            "displaced_gt_5": int(np.count_nonzero(displacement_time > 5)),
+
+            "n_flooded": int(flooded_size.sum()),
+            "affected_population": int(flooded_size[affected].sum()),
+        }
+
+    def track_neighbours(self):
+        """
+        Count the neighbours of each household satisfying each of NEIGHBOUR_COUNTERS,
+        counters are then updated when a HouseholdAgent sets a counted field.
+        Vectorized kernels write the arrays directly and don't update the counters.
+        """
+        self.neighbour_counts = {
+            name: self.count_neighbours(condition(getattr(self, field))).astype(np.int64)
+            for name, (field, condition) in NEIGHBOUR_COUNTERS.items()
+        }
+        self._stale_counts = False
+
+    def refresh_neighbour_counts(self):
+        """
+        recount the neighbours if the arrays were changed by run_quiescent
+        """
+        if self.neighbour_counts is not None and self._stale_counts:
+            self.track_neighbours()
+
+    def update_neighbour_counts(self, field, index, old_value, new_value):
+        """
+        update the counters of the households having household index as neighbour
+        after field changed from old_value to new_value
+        """
+        for name, condition in self._field_counters[field]:
+            change = int(bool(condition(new_value))) - int(bool(condition(old_value)))
+            if change:
+                self.neighbour_counts[name][self.model.neighbours.reverse_neighbours(index)] += change
+
+    def run_quiescent(self, stage):
+        """
+        run the given stage in bulk in a quiescent year, without flood event and early warning,
+        with the same results of the HouseholdAgent methods in any activation order.
+        Returns False if the stage has to be run as usual: the neighbour stages depend
+        on the activation order of the agents, and they are run in bulk only when
+        they can't change any household.
+        """
+        if stage in QUIESCENT_NOOP_STAGES:
+            return True
+
+        if stage in QUIESCENT_KERNEL_STAGES:
+            getattr(self, stage)()
+            self._stale_counts = True
+            return True
+
+        if stage == 'update_sentiments':
+            # no one is flooded or alerted: awareness and fear are reduced by 10%
+            active = self.normal_or_trapped() | self.status_changed
+            min_awareness = 0.5 if self.model.awareness_program else 0.3
+            self.awareness[active] = np.clip(self.awareness[active] - 0.1, min_awareness, 1)
+            self.fear[active] = np.clip(self.fear[active] - 0.1, 0.3, 1)
+            return True
+
+        if stage == 'check_neighbours_for_displacement':
+            # households follow displaced neighbours only if one of them does at the beginning
+            displaced = self.status == DISPLACED
+            if not displaced.any():
+                return True
+            follow = (self.status == NORMAL) & (self.perception >= 0.5) & \
+                (self.count_neighbours(displaced) > 0.75 * self.n_neighbours())
+            return not follow.any()
+
+        if stage == 'fix_neighbours_damage':
+            # helpers fix the neighbours damage only if one of them can at the beginning
+            damaged = self.house_damage > 0
+            if not damaged.any():
+                return True
+            return not (self.helping() & (self.count_neighbours(damaged) > 0)).any()
+
+        return False
+
+    def init_step(self):
+        """
+        set household status for each step to initial values
+        """
+        self.alerted[:] = False
+        self.prepared[:] = False
+        self.received_flood[:] = False
+        self.status_changed[:] = False
+        self.last_house_damage[:] = 0
+        self.last_livelihood_damage[:] = 0
+
+    def return_decision(self):
+        """
+        check household damage and decide status
+        """
+        evacuated = self.status == EVACUATED
+        displaced = self.status == DISPLACED
+
+        threshold = np.where(
+            self.income < POVERTY_LINE, LOW_DAMAGE_THRESHOLD, MEDIUM_DAMAGE_THRESHOLD
+        )
+        low_damage = self.house_damage < threshold
+        self.set_status(evacuated & low_damage, NORMAL)
+        self.set_status(evacuated & ~low_damage, DISPLACED)
+        self.set_status(displaced & (self.house_damage < LOW_DAMAGE_THRESHOLD), NORMAL)
+
+        moved = evacuated | displaced
+        still_displaced = moved & (self.status == DISPLACED)
+        self.displacement_time[still_displaced] += 1
+        self.displacement_time[moved & ~still_displaced] = 0
+
+    def displacement_decision(self):
+        """
+        check household damage and decide status
+        """
+        active = self.normal_or_trapped()
+
+        high_damage = (self.house_damage > MEDIUM_DAMAGE_THRESHOLD) | \
+            (self.livelihood_damage > MEDIUM_DAMAGE_THRESHOLD)
+        low_damage = (self.house_damage < LOW_DAMAGE_THRESHOLD) & \
+            (self.livelihood_damage < LOW_DAMAGE_THRESHOLD)
+        # in case of medium house damage or medium livelihood damage, check against perception
+        medium_damage = active & ~high_damage & ~low_damage & (self.perception >= 0.5)
+        can_move = (self.income > POVERTY_LINE) & ~self.obstacles_to_movement
+
+        self.set_status(active & high_damage, DISPLACED)
+        self.set_status(medium_damage & can_move, DISPLACED)
+        self.set_status(medium_damage & ~can_move, TRAPPED)
+
+    def check_neighbours_for_displacement(self):
+        """
+        update displacement decision based on neighbours
+        """
+        active = (self.status == NORMAL) & (self.perception >= 0.5)
+        neighbours_displaced = self.get_neighbour_count('displaced') > 0.75 * self.n_neighbours()
+        follow = active & neighbours_displaced
+        cannot_move = (self.income < POVERTY_LINE) | self.obstacles_to_movement
+
+        self.set_status(follow & cannot_move, TRAPPED)
+        self.set_status(follow & ~cannot_move, DISPLACED)
+
+    def check_for_early_warning(self):
+        """
+        check if governemnt has issued early warning
+        """
+        if not self.model.emitted_early_warning:
+            return
+
+        alerted = self.flood_prone & self.normal_or_trapped()
+        self.alerted[alerted] = True
+
+        trusting = alerted & (self.trust >= 0.5)
+        self.prepared[trusting] = True
+
+        evacuate = trusting & \
+            (self.status == NORMAL) & \
+            (self.income >= POVERTY_LINE) & \
+            ~self.obstacles_to_movement & \
+            (self.perception >= 0.5)
+        self.set_status(evacuate, EVACUATED)
+
+    def check_neighbours_for_evacuation(self):
+        """
+        check neighbours for early warning reaction
+        """
+        if not self.model.emitted_early_warning:
+            return
+
+        active = self.normal_or_trapped()
+        n_neighbours = self.n_neighbours()
+        neighbours_evacuated = self.get_neighbour_count('evacuated') > 0.5 * n_neighbours
+        neighbours_prepared = self.get_neighbour_count('prepared') > 0.5 * n_neighbours
+
+        evacuate = (self.status == NORMAL) & \
+            neighbours_evacuated & \
+            (self.income >= POVERTY_LINE) & \
+            ~self.obstacles_to_movement
+        self.set_status(evacuate, EVACUATED)
+        self.prepared[active & neighbours_prepared] = True
+
+    def react_to_flood(self):
+        """
+        react to flood
+        increment damage if household is flooded
+        """
+        if not self.model.flood_event:
+            return
+
+        flood_values = self.water_levels
+        self.received_flood[flood_values > 0] = True
+
+        # house damage using curve
+        new_damage = get_damages(flood_values, self.house_materials)
+        self.last_house_damage[:] = new_damage
+        self.house_damage[:] = np.maximum(self.house_damage, new_damage)
+
+        # livelihood damage isn't affected by preparedness
+        new_damage = flood_values / FLOOD_DAMAGE_MAX
+        self.last_livelihood_damage[:] = new_damage
+        self.livelihood_damage[:] = np.clip(self.livelihood_damage + new_damage, 0, 1)
+
+    def update_sentiments(self):
+        """
+        update sentiments based on previous events
+        """
+        active = self.normal_or_trapped() | self.status_changed
+        anyone_flooded = self.received_flood | (self.get_neighbour_count('flooded') > 0)
+        min_awareness = 0.5 if self.model.awareness_program else 0.3
+
+        # no one flooded: awareness, fear and trust (if alerted) are reduced by 10%
+        quiet = active & ~anyone_flooded
+        self.awareness[quiet] = np.clip(self.awareness[quiet] - 0.1, min_awareness, 1)
+        self.fear[quiet] = np.clip(self.fear[quiet] - 0.1, 0.3, 1)
+        quiet_alerted = quiet & self.alerted
+        self.trust[quiet_alerted] = np.clip(self.trust[quiet_alerted] - 0.1, 0, 1)
+
+        flooded = active & anyone_flooded
+        max_damage = np.maximum(self.last_house_damage, self.last_livelihood_damage)
+        damaged = flooded & (max_damage > LOW_DAMAGE_THRESHOLD)
+
+        # near-miss-event effect
+        neighbours_high_damage = self.get_neighbour_count('high_damage')
+        near_miss = flooded & ~damaged & (neighbours_high_damage > 0.25 * self.n_neighbours())
+        aware = near_miss.copy()
+        aware[near_miss] = self.draws['update_sentiments'][near_miss] < self.awareness[near_miss]
+        unaware = near_miss & ~aware
+
+        increase = damaged | aware
+        self.awareness[increase] = np.clip(self.awareness[increase] + 0.4, min_awareness, 1)
+        self.awareness[unaware] = np.clip(self.awareness[unaware] - 0.1, min_awareness, 1)
+
+        flooded_alerted = flooded & self.alerted
+        self.trust[flooded_alerted] = 1.0
+        self.fear[flooded_alerted] = np.clip(self.fear[flooded_alerted] + 0.1, 0, 1)
+
+        flooded_not_alerted = flooded & ~self.alerted
+        self.fear[flooded_not_alerted] = np.clip(self.fear[flooded_not_alerted] + 0.2, 0, 1)
+        self.trust[flooded_not_alerted] = np.clip(self.trust[flooded_not_alerted] - 0.1, 0, 1)
+
+    def fix_damage(self):
+        """
+        fix damage for all households
+        """
+        self.livelihood_damage[:] = np.clip(self.livelihood_damage - 0.3, 0, 1)
+
+        repaired = np.zeros(len(self), dtype=bool)
+        if self.model.house_repair_program > 0:
+            # government help is used to fix damage 100% if damage is above MEDIUM_DAMAGE_THRESHOLD
+            candidates = self.house_damage > MEDIUM_DAMAGE_THRESHOLD
+            repaired[candidates] = self.draws['fix_damage'][candidates] < self.model.house_repair_program
+            self.house_damage[repaired] = 0
+
+            if self.model.house_improvement_program:
+                self.house_materials[repaired] = CONCRETE
+
+        # recover only if household is not displaced or evacuated
+        # and if household has income above poverty line
+        income = self.income
+        recovering = ~repaired & (income > POVERTY_LINE) & self.normal_or_trapped()
+
+        # every unit of income above poverty line increases recovery by +10%
+        recovery = BASE_RICOVERY + (income[recovering] - POVERTY_LINE) / 10
+        recovery *= RECOVERY_FACTORS[self.house_materials[recovering]]
+        self.house_damage[recovering] = np.clip(self.house_damage[recovering] - recovery, 0, 1)
+
+    def fix_neighbours_damage(self):
+        """
+        fix damage for neighbours
+        """
+        n_helpers = self.get_neighbour_count('helpers')
+
+        damaged = (self.house_damage > 0) & (n_helpers > 0)
+        self.house_damage[damaged] = np.clip(
+            self.house_damage[damaged] - 0.05 * n_helpers[damaged], 0, 1
+        )
@@ -1,31 +1,23 @@
+import os
 from typing import List
 from datetime import datetime
-import geopandas as gpd
-import mesa_geo as mg
 import numpy as np
-from numpy.random import random
 import pandas as pd
-from shapely.geometry import Point
 
 import mesa
 from spaces import IGADSpace
-from agents import (STATUS_DISPLACED, STATUS_EVACUATED, STATUS_NORMAL,
-                    STATUS_TRAPPED, HouseholdAgent)
-from utils import get_events, load_population_data, MAPS_BASENAME, DF_SCENARIOS, DF_EVENTS, MAX_YEARS
+from households import STATISTICS, Households
+from context import get_population_sample, get_villages_context, sample_population
+from schedulers import IGADStagedActivation, VectorizedStagedActivation
+from profiling import Profiler
+from output import RunWriter, attach_params, get_agent_records, get_model_csv_filename, read_run
+from agents import HouseholdAgent
+from constants import STATUSES
+from utils import get_events, get_scenarios, get_villages, MAPS_BASENAME, MAX_YEARS
 
 
 RAND_POSITION = False
 
-VILLAGES = [
-    'Al-Gaili', 
-    'Wawise Garb', 
-    'Wad Ramli Camp', 
-    'Eltomaniat', 
-    'Al-Shuhada', 
-    'Wawise Oum Ojaija', 
-    'Wad Ramli'
-]
-
 STAGE_LIST = [
     'init_step', 
     'return_decision',
@@ -40,16 +32,12 @@ STAGE_LIST = [
 ]
         
 
-ALL_SETTLEMENTS = gpd.read_file('IGAD/settlements_grid_wdst_sampled.gpkg').to_crs(epsg=4326)
-BOUNDING_BOXES = gpd.read_file('IGAD/BoundingBox20022023/BoundingBox_20022023.shp').to_crs(epsg=4326)
-# select only the bounding box of the village
-ALL_POPULATION_DATA = load_population_data()
-
 class IGAD(mesa.Model):
     """Model class for the IGAD model."""
     def __init__(
         self, 
         save_to_csv=None,
+        stream_output=False,
         false_alarm_rate=None,
         false_negative_rate=None,
         trust=None,
@@ -59,11 +47,20 @@ class IGAD(mesa.Model):
         basic_income_program=None,
         awareness_program=None,
         scenario=None,
+        vectorized=False,
+        villages=None,
+        seed=None,
+        output_dir=None,
+        profile=False,
+        quiescent_fast_path=True,
+        n_threads=1,
         **kwargs
     ):
         """
         Create a new IGAD model.
-        :param positions:   List of tuples with the x and y coordinates of each agent
+        :param save_to_csv: Save the agent variables to output/data_<timestamp>.csv at the end of the run
+        :param stream_output:   Append the agent and model variables to output/data_<timestamp>
+                                at every step, see output_dir
         :param false_alarm_rate:    False alarm rate for the model
         :param false_negative_rate: False negative rate for the model
         :param trust:   Trust value for the model
@@ -72,29 +69,68 @@ class IGAD(mesa.Model):
         :param basic_income_program: Whether the government provides a basic income or not
         :param awareness_program: Whether the government provides awareness programs or not
         :param scenario:    Scenario to run
+        :param vectorized:  Run each stage as a vectorized kernel over all the households
+                            instead of calling each agent
+        :param villages:    List of active villages, if None villages are selected by
+                            the village_<n> keyword arguments, n is the index in get_villages()
+        :param seed:    Seed of the model random number generator, a non negative integer,
+                        runs with the same seed and parameters give the same results
+        :param output_dir:  Directory where the agent and model variables are appended at every step,
+                            agent variables are then not kept in memory. See output.read_run
+        :param profile:     Record the time of each part of every step in self.profiler,
+                            written to profile.json in output_dir at the end of the run
+        :param quiescent_fast_path: Run the years without flood event and early warning in bulk,
+                                    with the same results (see Households.run_quiescent)
+        :param n_threads:   Number of threads running each stage of the vectorized engine
+                            on chunks of households, with the same results
         :param **kwargs:   Additional keyword arguments
         """
         super().__init__()
 
-        self.save_to_csv = save_to_csv
+        # e.g. from the NumberInput of the web interface
+        if seed is not None:
+            if seed < 0 or seed != int(seed):
+                raise ValueError(f'seed must be a non negative integer, got {seed}')
+            seed = int(seed)
 
-        # Set random seed to reset random sequence
-        np.random.seed(0)
+        self.save_to_csv = save_to_csv
+        # current date
+        self.run_name = f'data_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+        if stream_output and output_dir is None:
+            output_dir = f'output/{self.run_name}'
+        self.output_dir = output_dir
+        self.writer = None
+
+        # every random draw of the model comes from its own generator,
+        # the agents activation order from self.random, seeded by mesa with the same seed
+        self.rng = np.random.default_rng(seed)
+        self.profiler = Profiler(enabled=profile)
 
         self.scenario = scenario
-        self.schedule = mesa.time.StagedActivation(self, 
-            stage_list=STAGE_LIST, 
-            shuffle_between_stages=True
-        )
+        self.vectorized = vectorized
+        if vectorized:
+            self.schedule = VectorizedStagedActivation(self,
+                stage_list=STAGE_LIST,
+                n_threads=n_threads
+            )
+        else:
+            self.schedule = IGADStagedActivation(self, 
+                stage_list=STAGE_LIST, 
+                shuffle_between_stages=True
+            )
         
         self.space = IGADSpace(crs='epsg:4326', 
             warn_crs_conversion=False, 
             reference=f'{MAPS_BASENAME}_0001_cut.tif'
         )
+        self.space.raster_layer.profiler = self.profiler
         
         self.steps = 0
         self.emitted_early_warning = False
         self.flood_event = False
+        self.quiescent_fast_path = quiescent_fast_path
+        # no flood event and no early warning in the current step
+        self.quiescent = False
 
         # active government programs
         self.do_early_warning = do_early_warning
@@ -112,76 +148,92 @@ class IGAD(mesa.Model):
         
 
         # extract villages from kwargs
-        active_villages = [
-            village 
-            for n, village in enumerate(VILLAGES)
-            if 
-            f'village_{n}' in kwargs and
-            kwargs[f'village_{n}'] == True
-        ]
-        self.load_data(villages=active_villages)
+        if villages is None:
+            active_villages = [
+                village 
+                for n, village in enumerate(get_villages())
+                if 
+                f'village_{n}' in kwargs and
+                kwargs[f'village_{n}'] == True
+            ]
+        else:
+            active_villages = list(villages)
+        self.load_data(villages=active_villages, seed=seed)
+        # neighbours within MAX_DISTANCE of every household
+        self.neighbours = self.context.neighbours
+
+        n_agents = len(self.context)
+
+        # household attributes are stored in arrays, agents are views on them
+        self.households = Households(self, n_agents)
+        self.households.base_income[:] = self.population.incomes
+        self.households.flood_prone[:] = self.context.flood_prones
+        self.households.awareness[:] = self.population.awarenesses
+        self.households.fear[:] = self.population.fears
+        #self.households.trust[:] = trusts
+        self.households.trust[:] = trust
+        self.households.household_size[:] = self.population.households_size
+        self.households.house_materials[:] = self.population.house_materials
+        self.households.obstacles_to_movement[:] = self.population.obstacles_to_movement
+        if not vectorized:
+            # agents read the neighbour counters instead of their neighbours
+            self.households.track_neighbours()
+
+        # water level of every household on every return period map
+        self.hazard = self.context.hazard
+        self.water_levels = self.hazard.get_dry()
 
-        
         self.agents = []      
         # Generate HouseHold Agents
-        ac_population = mg.AgentCreator(
-            HouseholdAgent,
-            model=self,
-            crs=self.space.crs,
-            agent_kwargs={},
-        )       
-        n_agents = len(self.positions)
-
-        for i in range(n_agents):
-            x, y = self.positions[i]
-            household = ac_population.create_agent(
-                Point(x, y), 
-                "H" + str(i)
+        for i, geometry in enumerate(self.context.geometries):
+            household = HouseholdAgent(
+                "H" + str(i),
+                model=self,
+                geometry=geometry,
+                crs=self.space.crs,
+                index=i,
             )
-            
-            # Assign attributes            
-            household.base_income = self.incomes[i]
-            household.flood_prone = bool(self.flood_prones[i])
-            household.awareness = self.awarenesses[i]
-            household.fear = self.fears[i]
-            #household.trust = trusts[i]
-            household.trust = trust
-            household.household_size = self.households_size[i]
-            household.house_materials = self.house_materials[i]
-            household.obstacles_to_movement = bool(self.obstacles_to_movement[i])
-
-            self.space.add_agents(household)
+
             self.schedule.add(household)
             self.agents.append(household)
-
-        self.datacollector.collect(self)
+        if self.agents:
+            # a single bulk insert in the spatial index, that can't be built empty
+            self.space.add_agents(self.agents)
+
+        # e.g. to replay the run, see replay.py
+        self.model_params = dict(
+            false_alarm_rate=false_alarm_rate,
+            false_negative_rate=false_negative_rate,
+            trust=trust,
+            do_early_warning=do_early_warning,
+            house_repair_program=house_repair_program,
+            house_improvement_program=house_improvement_program,
+            basic_income_program=basic_income_program,
+            awareness_program=awareness_program,
+            scenario=scenario,
+            vectorized=vectorized,
+            villages=active_villages,
+            seed=seed,
+        )
+        if self.output_dir is not None:
+            self.writer = RunWriter(
+                self.output_dir,
+                agent_ids=[agent.unique_id for agent in self.agents],
+                model_columns=list(self.datacollector.model_reporters),
+                model_params=self.model_params,
+            )
+        self.collect()
 
     def create_datacollector(self):
         """Create the datacollector."""
         self.datacollector = mesa.DataCollector(
+            # all the statistics are computed at once by collect
             model_reporters={
-                "n_displaced": lambda this: len([a for a in this.agents if a.status == STATUS_DISPLACED]),
-                "n_normal": lambda this: len([a for a in this.agents if a.status == STATUS_NORMAL]),
-                "n_evacuated": lambda this: len([a for a in this.agents if a.status == STATUS_EVACUATED]),
-                "n_trapped": lambda this: len([a for a in this.agents if a.status == STATUS_TRAPPED]),
-                
-                "mean_house_damage": lambda this: np.mean([a.house_damage for a in this.agents]) * 100,
-                "mean_livelihood_damage": lambda this: np.mean([a.livelihood_damage for a in this.agents]) * 100,
-                "mean_trust": lambda this: np.mean([a.trust for a in this.agents]) * 100,
-                "mean_perception": lambda this: np.mean([a.perception for a in this.agents]) * 100,
-                "mean_income": lambda this: np.mean([a.income for a in this.agents]) * 100,
-                "mean_awareness": lambda this: np.mean([a.awareness for a in this.agents]) * 100,
-                "mean_fear": lambda this: np.mean([a.fear for a in this.agents]) * 100,
-                "displaced_lte_2": lambda this: sum([1 <= a.displacement_time <= 2  for a in this.agents]),
-                "displaced_lte_5": lambda this: sum([2 < a.displacement_time <= 5 for a in this.agents]),
-                "displaced_gt_5": lambda this: sum([ a.displacement_time > 5 for a in this.agents]),
-
-                "n_flooded": lambda this: sum([a.household_size for a in this.agents if a.received_flood]),
-                "affected_population": lambda this: sum([a.household_size for a in this.agents if a.received_flood and a.status in [STATUS_NORMAL, STATUS_TRAPPED]]),
-
+                name: self.profiler.wrap(f'reporter.{name}', lambda this, name=name: this.statistics[name])
+                for name in STATISTICS
             },
-            agent_reporters={
-                "status": lambda agent: agent.status,
+            agent_reporters={} if self.output_dir is not None else {
+                "status": lambda agent: STATUSES[agent.status],
                 "flooded": lambda agent: agent.received_flood,
                 "alerted": lambda agent: agent.alerted,
                 "house_damage": lambda agent: agent.house_damage,
@@ -193,49 +245,37 @@ class IGAD(mesa.Model):
             },
         )
 
-    def load_data(self, villages: List[str]):
+    def collect(self):
+        """
+        Collect the model and agent variables of the current step,
+        and append them to the output files if the model has an output directory
+        """
+        with self.profiler.measure('statistics'):
+            self.statistics = self.households.get_statistics()
+        with self.profiler.measure('datacollector'):
+            self.datacollector.collect(self)
+        if self.writer is not None:
+            with self.profiler.measure('output'):
+                self.writer.write(get_agent_records(self.households), self.statistics)
+
+    def load_data(self, villages: List[str], seed=None):
         """
         Load data from population, settlements and flood events.
+        Data not depending on the model parameters are shared by the models
+        with the same villages, and the population sample by the models with the same seed,
+        see context.py
         """
-        start_year, end_year = DF_SCENARIOS.loc[self.scenario, ['start_year', 'end_year']]
+        start_year, end_year = get_scenarios().loc[self.scenario, ['start_year', 'end_year']]
         self.events = get_events(start_year=start_year, end_year=end_year)
 
-        self.incomes = []
-        self.flood_prones = []
-        self.awarenesses = []
-        self.house_materials = []
-        self.households_size = []
-        self.obstacles_to_movement = []
-        self.fears = []
-        self.positions = []
-
-        for village in villages:
-            print('Loading data for village', village)
-
-            bounding_boxes = BOUNDING_BOXES.query('village == @village')            
-            for id, bounding_box in bounding_boxes.iterrows():
-                flood_prone = bounding_box.floodprone == 1
-                settlements = ALL_SETTLEMENTS[ALL_SETTLEMENTS.geometry.within(bounding_box.geometry)]
-
-                n_households = len(settlements)
-
-                village_lons = settlements.geometry.centroid.x
-                village_lats = settlements.geometry.centroid.y
-
-                village_flood_prones = [flood_prone] * n_households
-                village_positions = list(zip(village_lons, village_lats))
-                village_data = ALL_POPULATION_DATA\
-                        .query('village == @village')\
-                        .sample(n_households, replace=True)
-
-                self.positions += village_positions
-                self.incomes += village_data['income'].values.tolist()
-                self.flood_prones += village_flood_prones #.tolist()
-                self.awarenesses += village_data['awareness'].values.tolist()
-                self.house_materials += village_data['walls_materials'].values.tolist()
-                self.households_size += village_data['household_size'].values.tolist()
-                self.obstacles_to_movement += village_data['obstacles_to_movement'].values.tolist()
-                self.fears += village_data['fear_of_flood'].tolist()
+        self.context = get_villages_context(tuple(villages))
+        self.positions = self.context.positions
+        if seed is None:
+            self.population = sample_population(tuple(villages), self.rng)
+        else:
+            self.population = get_population_sample(tuple(villages), seed)
+            # continue from the draws of the sample
+            self.rng.bit_generator.state = self.population.rng_state
 
 
     def __has_floods(self):
@@ -257,9 +297,9 @@ class IGAD(mesa.Model):
 
         emit = False
         if self.__has_floods():    
-            emit = not self.random.random() <= self.false_negative_rate 
+            emit = not self.rng.random() <= self.false_negative_rate 
         else:
-            emit = self.random.random() <= self.false_alarm_rate
+            emit = self.rng.random() <= self.false_alarm_rate
         
         if not emit:
             return 
@@ -275,9 +315,11 @@ class IGAD(mesa.Model):
         if self.__has_floods():
             events = self.events[self.steps]
             event_filenames = [event['filename'] for event in events]
+            self.water_levels = self.hazard.get_water_levels(event_filenames)
             self.space.update_water_level(event_filenames)  
             self.flood_event = True
         else:
+            self.water_levels = self.hazard.get_dry()
             self.space.reset_water_level()
             self.flood_event = False
 
@@ -285,17 +327,50 @@ class IGAD(mesa.Model):
     def step(self):
         """Run one step of the model."""
         self.steps += 1
-        self.maybe_emit_early_warning()
-        self.update_flood()
-        self.schedule.step()
-        self.datacollector.collect(self)
+        self.profiler.start_step(self.steps)
+        with self.profiler.measure('step'):
+            self.maybe_emit_early_warning()
+            with self.profiler.measure('update_flood'):
+                self.update_flood()
+            self.households.draw_random(self.rng)
+            self.quiescent = self.quiescent_fast_path and \
+                not self.flood_event and not self.emitted_early_warning
+            self.schedule.step()
+            with self.profiler.measure('collect'):
+                self.collect()
         
         if self.steps >= MAX_YEARS:
             self.running = False
+            self.close()
             if self.save_to_csv:
-                # current date
-                now = datetime.now().strftime("%Y%m%d_%H%M%S")
-                df = self.datacollector.get_agent_vars_dataframe()
-                df.to_csv(f'output/data_{now}.csv')
+                self.save_csv(f'output/{self.run_name}.csv')
+
+    def close(self):
+        """
+        Close the output files, at the end of the run or when it is stopped before,
+        e.g. by a reset of the web interface. The steps written are kept
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            if self.profiler.enabled:
+                self.profiler.to_json(os.path.join(self.output_dir, 'profile.json'))
+
+    def save_csv(self, filename: str):
+        """
+        Save the agent variables of every step to a csv file,
+        read from the output files (with their precision) if agent variables are not kept in memory.
+        The model variables are saved with the model parameters to <filename>_model.csv,
+        to replay the run (see output.CsvRunReader)
+        """
+        if self.output_dir is not None:
+            _, df = read_run(self.output_dir)
+        else:
+            df = self.datacollector.get_agent_vars_dataframe()
+        df.to_csv(filename)
+
+        df_model = self.datacollector.get_model_vars_dataframe()
+        df_model.index.name = 'step'
+        attach_params(df_model, self.model_params).to_csv(get_model_csv_filename(filename), index=False)
 
 
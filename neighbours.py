@@ -0,0 +1,88 @@
+from typing import List
+
+import numpy as np
+import shapely
+
+from cache import get_cache_path, get_key, load_arrays, save_arrays
+
+
+class NeighbourGraph:
+    """
+    Neighbours of every household in CSR format:
+    neighbours of household i are indices[offsets[i]:offsets[i+1]].
+    Each household is a neighbour of itself, as in GeoSpace.get_neighbors_within_distance.
+    """
+
+    def __init__(self, offsets: np.ndarray, indices: np.ndarray):
+        self.offsets = offsets
+        self.indices = indices
+        # household owning each entry of indices
+        self.rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        self._reverse = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_points(cls, xs: np.ndarray, ys: np.ndarray, distance: float) -> 'NeighbourGraph':
+        """
+        Build the graph with a single STRtree query of the buffered points.
+        The buffer is the same used by GeoSpace.get_neighbors_within_distance
+        """
+        points = shapely.points(xs, ys)
+        buffers = shapely.buffer(points, distance, quad_segs=16)
+        rows, indices = shapely.STRtree(points).query(buffers, predicate='intersects')
+
+        order = np.lexsort((indices, rows))
+        rows, indices = rows[order], indices[order]
+        offsets = np.zeros(len(points) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(rows, minlength=len(points)))
+        return cls(offsets, indices.astype(np.int64))
+
+    def neighbours(self, i: int) -> np.ndarray:
+        return self.indices[self.offsets[i]:self.offsets[i + 1]]
+
+    def reverse_neighbours(self, i: int) -> np.ndarray:
+        """
+        households having household i as neighbour
+        """
+        if self._reverse is None:
+            order = np.argsort(self.indices, kind='stable')
+            offsets = np.zeros(len(self) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(self.indices, minlength=len(self)))
+            self._reverse = (offsets, self.rows[order])
+        offsets, rows = self._reverse
+        return rows[offsets[i]:offsets[i + 1]]
+
+    def degree(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def count(self, mask: np.ndarray) -> np.ndarray:
+        """
+        number of neighbours of each household for which mask is True
+        """
+        return np.bincount(self.rows, weights=mask[self.indices], minlength=len(self))
+
+    def count_as_neighbour(self, mask: np.ndarray) -> np.ndarray:
+        """
+        number of households for which mask is True having each household as neighbour
+        """
+        return np.bincount(self.indices[mask[self.rows]], minlength=len(self))
+
+
+def get_neighbour_graph(villages: List[str], positions: List[tuple], distance: float) -> NeighbourGraph:
+    """
+    Returns the neighbour graph of the households of the given villages,
+    cached on disk by village set. The cache is rebuilt if the positions change.
+    """
+    xs, ys = np.array(positions, dtype=np.float64).reshape(-1, 2).T
+    path = get_cache_path('neighbours', get_key(villages, distance))
+    checksum = get_key(xs, ys)
+
+    arrays = load_arrays(path, checksum)
+    if arrays is not None:
+        return NeighbourGraph(arrays['offsets'], arrays['indices'])
+
+    graph = NeighbourGraph.from_points(xs, ys, distance)
+    save_arrays(path, checksum, offsets=graph.offsets, indices=graph.indices)
+    return graph
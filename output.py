@@ -0,0 +1,389 @@
+"""
+Streaming output of the model and agent variables.
+Every variable is a raw binary column file in the run directory, one record
+per step (model variables) or per step and household (agent variables) is
+appended after each step. schema.json describes the columns and the model
+parameters: a run stopped partway is read up to its last complete step.
+Runs saved as csv files, by IGAD.save_csv or batch.py, are read with the same
+interface by CsvRunReader.
+"""
+import glob
+import io
+import json
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from constants import STATUSES
+
+# agent variables and their dtype in the output files
+AGENT_COLUMNS = {
+    'status': 'i1',
+    'flooded': '?',
+    'alerted': '?',
+    'house_damage': 'f4',
+    'livelihood_damage': 'f4',
+    'trust': 'f4',
+    'perception': 'f4',
+    'income': 'f4',
+    'displacement_time': 'i2',
+}
+MODEL_DTYPE = 'f8'
+SCHEMA_FILE = 'schema.json'
+# model variables and parameters of a run saved as csv, next to its agent variables
+MODEL_CSV_SUFFIX = '_model.csv'
+
+
+def get_agent_records(households) -> Dict[str, np.ndarray]:
+    """
+    Agent variables of all the households, status is stored as its code in STATUSES
+    """
+    return {
+        'status': households.status,
+        'flooded': households.received_flood,
+        'alerted': households.alerted,
+        'house_damage': households.house_damage,
+        'livelihood_damage': households.livelihood_damage,
+        'trust': households.trust,
+        'perception': households.perception,
+        'income': households.income,
+        'displacement_time': households.displacement_time,
+    }
+
+
+class RunWriter:
+    """
+    Appends the variables of each step of a model run to column files in a directory
+    """
+
+    def __init__(self, path: str, agent_ids: List[str], model_columns: List[str], model_params: Dict = None):
+        """
+        Create the run directory and its schema
+        :param path:            Directory of the run
+        :param agent_ids:       unique_id of the agents, in households order
+        :param model_columns:   Names of the model variables
+        :param model_params:    Parameters of the model, e.g. to replay the run (see replay.py)
+        """
+        self.path = path
+        self.n_agents = len(agent_ids)
+        self.model_columns = list(model_columns)
+        os.makedirs(path, exist_ok=True)
+
+        schema = dict(
+            agent_ids=list(agent_ids),
+            agent_columns=AGENT_COLUMNS,
+            statuses=STATUSES,
+            model_columns=self.model_columns,
+            model_dtype=MODEL_DTYPE,
+            model_params=model_params,
+        )
+        tmp_path = os.path.join(path, f'{SCHEMA_FILE}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(schema, f)
+        os.replace(tmp_path, os.path.join(path, SCHEMA_FILE))
+
+        self._files = {
+            name: open(os.path.join(path, f'agent_{name}.bin'), 'wb')
+            for name in AGENT_COLUMNS
+        }
+        self._files.update({
+            name: open(os.path.join(path, f'model_{name}.bin'), 'wb')
+            for name in self.model_columns
+        })
+
+    def write(self, agent_records: Dict[str, np.ndarray], model_records: Dict[str, float]):
+        """
+        Append the records of one step, files are flushed so the step is readable
+        """
+        for name, dtype in AGENT_COLUMNS.items():
+            self._files[name].write(np.asarray(agent_records[name], dtype=dtype).tobytes())
+        for name in self.model_columns:
+            self._files[name].write(np.asarray(model_records[name], dtype=MODEL_DTYPE).tobytes())
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+
+def read_run(path: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Read a run written by RunWriter, up to its last complete step.
+    Returns the model variables indexed by step and the agent variables
+    indexed by (Step, AgentID), as the mesa DataCollector dataframes.
+    Status is a categorical column.
+    """
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+    n_agents = len(schema['agent_ids'])
+
+    def read_column(filename, dtype, n_records):
+        data = np.fromfile(os.path.join(path, filename), dtype=dtype)
+        return data[:len(data) // n_records * n_records]
+
+    agent_columns = {
+        name: read_column(f'agent_{name}.bin', dtype, n_agents)
+        for name, dtype in schema['agent_columns'].items()
+    }
+    model_columns = {
+        name: read_column(f'model_{name}.bin', schema['model_dtype'], 1)
+        for name in schema['model_columns']
+    }
+    n_steps = min(
+        [len(values) // n_agents for values in agent_columns.values()] +
+        [len(values) for values in model_columns.values()]
+    )
+
+    df_model = pd.DataFrame({name: values[:n_steps] for name, values in model_columns.items()})
+    df_model.index.name = 'Step'
+
+    index = pd.MultiIndex.from_product(
+        [range(n_steps), schema['agent_ids']], names=['Step', 'AgentID']
+    )
+    df_agents = pd.DataFrame(
+        {name: values[:n_steps * n_agents] for name, values in agent_columns.items()},
+        index=index
+    )
+    df_agents['status'] = pd.Categorical.from_codes(df_agents['status'], schema['statuses'])
+    return df_model, df_agents
+
+
+class RunReader:
+    """
+    Reads the steps of a run written by RunWriter one at a time:
+    only the records of the requested step are read from the column files,
+    and steps appended after the reader was created are read as well
+    """
+
+    def __init__(self, path: str):
+        """
+        Read the schema of the run
+        :param path:    Directory of the run
+        """
+        self.path = path
+        with open(os.path.join(path, SCHEMA_FILE)) as f:
+            schema = json.load(f)
+        self.agent_ids = schema['agent_ids']
+        self.agent_columns = schema['agent_columns']
+        self.statuses = schema['statuses']
+        self.model_columns = schema['model_columns']
+        self.model_dtype = schema['model_dtype']
+        # None for runs written before the parameters were saved
+        self.model_params = schema.get('model_params')
+
+    def _get_column_file(self, name: str, agent: bool) -> Tuple[str, np.dtype, int]:
+        if agent:
+            return os.path.join(self.path, f'agent_{name}.bin'), np.dtype(self.agent_columns[name]), len(self.agent_ids)
+        return os.path.join(self.path, f'model_{name}.bin'), np.dtype(self.model_dtype), 1
+
+    @property
+    def n_steps(self) -> int:
+        """
+        number of complete steps in the files
+        """
+        sizes = [
+            os.path.getsize(filename) // (dtype.itemsize * n_records)
+            for filename, dtype, n_records in (
+                [self._get_column_file(name, True) for name in self.agent_columns] +
+                [self._get_column_file(name, False) for name in self.model_columns]
+            )
+        ]
+        return min(sizes)
+
+    def _read(self, name: str, agent: bool, step: int) -> np.ndarray:
+        filename, dtype, n_records = self._get_column_file(name, agent)
+        return np.fromfile(filename, dtype=dtype, count=n_records, offset=step * n_records * dtype.itemsize)
+
+    def read_step(self, step: int) -> Tuple[Dict[str, np.ndarray], Dict[str, float]]:
+        """
+        Returns the agent variables of every household and the model variables of step.
+        Status is the code in statuses
+        """
+        if not 0 <= step < self.n_steps:
+            raise IndexError(f'step {step} not in the run, it has {self.n_steps} steps')
+        agent_records = {name: self._read(name, True, step) for name in self.agent_columns}
+        model_records = {name: self._read(name, False, step).item() for name in self.model_columns}
+        return agent_records, model_records
+
+
+def attach_params(df: pd.DataFrame, params: Dict, **identifiers) -> pd.DataFrame:
+    """
+    Add the identifiers and the parameters of a run as the first columns of its
+    model variables, before the step column. Lists (villages) are joined by '|'
+    """
+    df = df.reset_index()
+    columns = dict(identifiers)
+    for name, value in params.items():
+        columns[name] = '|'.join(value) if isinstance(value, list) else value
+    for position, (name, value) in enumerate(columns.items()):
+        df.insert(position, name, value)
+    return df
+
+
+def read_model_csv(filename: str) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Read the model variables of a run written with attach_params.
+    Returns the model variables indexed by step and the parameters of the run
+    """
+    df = pd.read_csv(filename)
+    position = df.columns.get_loc('step')
+    params = {}
+    for name in df.columns[:position]:
+        value = df[name].iloc[0] if len(df) else None
+        if isinstance(value, np.generic):
+            value = value.item()
+        if name == 'villages':
+            value = value.split('|') if isinstance(value, str) else []
+        params[name] = value
+    return df.iloc[:, position:].set_index('step'), params
+
+
+def get_model_csv_filename(filename: str) -> str:
+    """
+    csv file of the model variables of the run saved in the agent variables csv filename
+    """
+    return os.path.splitext(filename)[0] + MODEL_CSV_SUFFIX
+
+
+class CsvRunReader:
+    """
+    Reads the steps of a run saved as csv one at a time, as RunReader:
+    - the agent variables of every step (Step, AgentID and AGENT_COLUMNS columns),
+      written by IGAD.save_csv with the model variables and parameters in <name>_model.csv
+    - or only the model variables and parameters, written by batch.py without --agents
+    Agent variables are read one Step group at a time,
+    the offsets of the groups already found are kept to seek back
+    """
+
+    def __init__(self, path: str):
+        """
+        Read the header and the first step of the run
+        :param path:    csv file of the run
+        """
+        self.path = path
+        self.statuses = STATUSES
+        self.agent_columns = {}
+        self.agent_ids = []
+        self.model_columns = []
+        self.model_params = None
+        self._df_model = None
+        self._n_agent_steps = None
+
+        with open(path, 'rb') as f:
+            self._columns = f.readline().decode().rstrip('\r\n').split(',')
+            if 'AgentID' not in self._columns:
+                model_filename = path
+            else:
+                model_filename = get_model_csv_filename(path)
+                self.agent_columns = {name: AGENT_COLUMNS[name] for name in self._columns[2:]}
+                # byte offset of the first line of each step found so far
+                self._offsets = [f.tell()]
+                lines = []
+                while True:
+                    line = f.readline()
+                    if lines and line.split(b',', 1)[0] != lines[0].split(b',', 1)[0]:
+                        break
+                    if not line:
+                        break
+                    lines.append(line)
+                self.agent_ids = [line.split(b',', 2)[1].decode() for line in lines]
+                self._offsets.append(self._offsets[0] + sum(map(len, lines)))
+                self._n_agent_steps = self._get_n_agent_steps(f, lines)
+
+        if os.path.exists(model_filename):
+            self._df_model, self.model_params = read_model_csv(model_filename)
+            self.model_columns = list(self._df_model.columns)
+
+    def _get_n_agent_steps(self, f, first_lines: List[bytes]) -> int:
+        """
+        number of steps from the Step of the first and of the last line of the file
+        """
+        if not first_lines:
+            return 0
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 65536, 0))
+        last_line = f.read().rstrip(b'\r\n').rsplit(b'\n', 1)[-1]
+        return int(last_line.split(b',', 1)[0]) - int(first_lines[0].split(b',', 1)[0]) + 1
+
+    @property
+    def n_steps(self) -> int:
+        """
+        number of steps with both the agent and the model variables saved
+        """
+        sizes = []
+        if self._n_agent_steps is not None:
+            sizes.append(self._n_agent_steps)
+        if self._df_model is not None:
+            sizes.append(len(self._df_model))
+        return min(sizes, default=0)
+
+    def _read_agents(self, step: int) -> Dict[str, np.ndarray]:
+        n_agents = len(self.agent_ids)
+        with open(self.path, 'rb') as f:
+            # every step has a line for each household
+            while len(self._offsets) <= step:
+                f.seek(self._offsets[-1])
+                for _ in range(n_agents):
+                    f.readline()
+                self._offsets.append(f.tell())
+            f.seek(self._offsets[step])
+            data = b''.join(f.readline() for _ in range(n_agents))
+        df = pd.read_csv(io.BytesIO(data), header=None, names=self._columns)
+        records = {
+            name: df[name].to_numpy(dtype=dtype)
+            for name, dtype in self.agent_columns.items() if name != 'status'
+        }
+        if 'status' in self.agent_columns:
+            records['status'] = pd.Categorical(df['status'], categories=self.statuses).codes.astype('i1')
+        return records
+
+    def read_step(self, step: int) -> Tuple[Dict[str, np.ndarray], Dict[str, float]]:
+        """
+        Returns the agent variables of every household and the model variables of step.
+        Status is the code in statuses
+        """
+        if not 0 <= step < self.n_steps:
+            raise IndexError(f'step {step} not in the run, it has {self.n_steps} steps')
+        if self.agent_ids:
+            agent_records = self._read_agents(step)
+        else:
+            agent_records = {name: np.empty(0, dtype=dtype) for name, dtype in AGENT_COLUMNS.items()}
+        model_records = {}
+        if self._df_model is not None:
+            model_records = self._df_model.iloc[step].to_dict()
+        return agent_records, model_records
+
+
+def get_run_reader(path: str):
+    """
+    Reader of a run found by find_runs, RunReader for directories and CsvRunReader for csv files
+    """
+    if os.path.isdir(path):
+        return RunReader(path)
+    return CsvRunReader(path)
+
+
+def find_runs(path: str = 'output') -> List[str]:
+    """
+    Runs in path and its subdirectories: directories written by RunWriter,
+    agent variables csv files written by IGAD.save_csv (data_*.csv) and model variables
+    csv files written by batch.py (runs/*.csv), unless their agent variables are also saved
+    """
+    root = glob.escape(path)
+    runs = [
+        os.path.dirname(schema_file)
+        for schema_file in glob.glob(os.path.join(root, '**', SCHEMA_FILE), recursive=True)
+    ]
+    runs += [
+        filename for filename in glob.glob(os.path.join(root, '**', 'data_*.csv'), recursive=True)
+        if not filename.endswith(MODEL_CSV_SUFFIX)
+    ]
+    runs += [
+        filename for filename in glob.glob(os.path.join(root, '**', 'runs', '*.csv'), recursive=True)
+        # batch runs with the agent variables, see batch.run_and_save
+        if not os.path.isdir(f'{os.path.splitext(filename)[0]}_agents')
+    ]
+    return sorted(runs)
@@ -0,0 +1,113 @@
+"""
+Opt-in profiling of the model steps, enabled with IGAD(profile=True).
+Wall time and number of calls of each stage, model reporter, flood update,
+raster read and data collection are recorded separately for every step.
+"""
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict
+
+import pandas as pd
+
+_DISABLED = nullcontext()
+
+
+class Profiler:
+    """
+    Wall time and calls of named sections, for each step of a run.
+    A disabled profiler doesn't record anything: measure returns a shared
+    null context and wrap returns the function unchanged.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        # step -> name -> [time, calls]
+        self.steps: Dict[int, Dict[str, list]] = {}
+        self.start_step(0)
+
+    def start_step(self, step: int):
+        """
+        record the following measures in step
+        """
+        if self.enabled:
+            self._current = self.steps.setdefault(step, defaultdict(lambda: [0.0, 0]))
+
+    def add(self, name: str, seconds: float, calls: int = 1):
+        record = self._current[name]
+        record[0] += seconds
+        record[1] += calls
+
+    def measure(self, name: str, calls: int = 1):
+        """
+        context manager measuring the wall time of its block
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._measure(name, calls)
+
+    @contextmanager
+    def _measure(self, name, calls):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, calls)
+
+    def wrap(self, name: str, function):
+        """
+        returns function measuring each of its calls
+        """
+        if not self.enabled:
+            return function
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return wrapper
+
+    def as_dict(self) -> Dict:
+        """
+        profile of the run: for every step, time (seconds) and calls of each measure
+        """
+        return {
+            'steps': [
+                {
+                    'step': step,
+                    'measures': {
+                        name: {'time': seconds, 'calls': calls}
+                        for name, (seconds, calls) in measures.items()
+                    }
+                }
+                for step, measures in sorted(self.steps.items())
+            ]
+        }
+
+    def to_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=4)
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Returns a table with the total and mean time per step, the calls
+        and the share of the step time of each measure, slowest first
+        """
+        rows = defaultdict(lambda: [0.0, 0])
+        for measures in self.steps.values():
+            for name, (seconds, calls) in measures.items():
+                rows[name][0] += seconds
+                rows[name][1] += calls
+
+        df = pd.DataFrame(
+            [(name, seconds, calls) for name, (seconds, calls) in rows.items()],
+            columns=['measure', 'total_time', 'calls']
+        ).set_index('measure')
+        n_steps = max(len(self.steps) - 1, 1)
+        df['time_per_step'] = df['total_time'] / n_steps
+        step_time = df['total_time'].get('step', df['total_time'].sum())
+        df['share'] = df['total_time'] / step_time * 100 if step_time else 0.0
+        return df.sort_values('total_time', ascending=False)
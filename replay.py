@@ -0,0 +1,146 @@
+"""
+Replay of a run saved by RunWriter or as csv files (see output.py), without running the model.
+ReplayModel reads one step of the run at every model step, and exposes it as
+the IGAD attributes read by the visualization elements of server.py.
+"""
+from typing import Dict, List
+
+import mesa
+import numpy as np
+
+from agents import HouseholdAgent
+from context import get_villages_context
+from households import HouseholdField
+from output import get_run_reader
+from spaces import IGADSpace
+from utils import get_events, get_scenarios, get_villages, MAPS_BASENAME
+
+
+class StepRecords:
+    """
+    Agent variables of all the households at a step of a run,
+    one array per column of the run (see output.AGENT_COLUMNS)
+    """
+
+    def __init__(self, records: Dict[str, np.ndarray], statuses: List[str]):
+        self.statuses = statuses
+        for name, values in records.items():
+            setattr(self, name, values)
+
+    def copy(self):
+        """
+        records are not modified, see Households.copy
+        """
+        return self
+
+    def get_description(self, index):
+        """
+        variables of household index shown in the map popups
+        """
+        return {
+            'damage': f"h: {int(100 * self.house_damage[index])}% - l: {int(100 * self.livelihood_damage[index])}%",
+            'status': self.statuses[self.status[index]],
+            'income': f"{self.income[index]:.2f}",
+            'perception': f"{int(100 * self.perception[index])}%",
+            'trust': f"{int(100 * self.trust[index])}%",
+            'received_flood': self.flooded[index].item(),
+            'alerted': self.alerted[index].item(),
+            'displacement_time': self.displacement_time[index].item(),
+        }
+
+
+class ReplayAgent(HouseholdAgent):
+    """
+    Household of a replayed run, reading the variables of the current step.
+    Variables not in the run are not available
+    """
+    income = HouseholdField()
+    perception = HouseholdField()
+    received_flood = HouseholdField('flooded')
+
+    def get_description(self):
+        return {'id': self.unique_id, **self.model.households.get_description(self.index)}
+
+
+class ReplayModel(mesa.Model):
+    """Replay of a stored run of the IGAD model."""
+
+    def __init__(self, path: str, villages: List[str] = None, scenario: str = None):
+        """
+        Open a stored run, only the first step is read
+        :param path:        Directory or csv file of the run, see output.find_runs.
+                            Runs saved without the agent variables only replay the charts and the flood maps
+        :param villages:    Villages of the run, by default the ones in its parameters
+                            or all the villages for runs without parameters
+        :param scenario:    Scenario of the run for the flood maps, by default the one in its parameters,
+                            the map has no flood if it isn't known
+        """
+        super().__init__()
+        self.reader = get_run_reader(path)
+        model_params = self.reader.model_params or {}
+        if villages is None:
+            villages = model_params.get('villages', get_villages())
+        if scenario is None:
+            scenario = model_params.get('scenario')
+        self.scenario = scenario
+
+        geometries = []
+        if self.reader.agent_ids:
+            context = get_villages_context(tuple(villages))
+            if len(context) != len(self.reader.agent_ids):
+                raise ValueError(
+                    f'{path} has {len(self.reader.agent_ids)} households, '
+                    f'{len(context)} in the villages {list(villages)}'
+                )
+            geometries = context.geometries
+        self.events = {}
+        if scenario is not None:
+            start_year, end_year = get_scenarios().loc[scenario, ['start_year', 'end_year']]
+            self.events = get_events(start_year=start_year, end_year=end_year)
+
+        # steps only, agents read the stored variables
+        self.schedule = mesa.time.BaseScheduler(self)
+        self.space = IGADSpace(crs='epsg:4326',
+            warn_crs_conversion=False,
+            reference=f'{MAPS_BASENAME}_0001_cut.tif'
+        )
+        self.datacollector = mesa.DataCollector(
+            model_reporters={
+                name: lambda this, name=name: this.statistics[name]
+                for name in self.reader.model_columns
+            }
+        )
+
+        self.agents = [
+            ReplayAgent(agent_id, model=self, geometry=geometry, crs=self.space.crs, index=i)
+            for i, (agent_id, geometry) in enumerate(zip(self.reader.agent_ids, geometries))
+        ]
+        if self.agents:
+            self.space.add_agents(self.agents)
+
+        self.steps = 0
+        self.load_step()
+
+    def load_step(self):
+        """
+        Read the variables of the current step and the flood maps of its events,
+        the run is over at its last complete step
+        """
+        agent_records, self.statistics = self.reader.read_step(self.steps)
+        self.households = StepRecords(agent_records, self.reader.statuses)
+        # the initial state is collected before the events of any step, as in IGAD
+        if self.steps > 0 and self.steps in self.events:
+            self.space.update_water_level([event['filename'] for event in self.events[self.steps]])
+        else:
+            self.space.reset_water_level()
+        self.datacollector.collect(self)
+        self.running = self.steps + 1 < self.reader.n_steps
+
+    def step(self):
+        """Read the next step of the run, the model stops at the last one."""
+        if self.steps + 1 >= self.reader.n_steps:
+            self.running = False
+            return
+        self.steps += 1
+        self.schedule.step()
+        self.load_step()
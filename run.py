@@ -1,6 +1,3 @@
-import numpy as np
 from server import server
 
-np.random.seed(0)
-
 server.launch()
@@ -0,0 +1,182 @@
+"""
+Web server running the model ahead of the browser.
+At every reset of a browser the whole run is computed in a background thread, and the
+state of every step is buffered as the message sent to the browser, which
+plays, pauses and seeks any step of the buffer without running the model
+on the request path.
+"""
+import json
+import threading
+from typing import Dict, List, Optional
+
+import mesa
+import tornado.escape
+import tornado.gen
+from mesa.visualization.ModularVisualization import SocketHandler, is_user_param
+
+# seconds between the checks for a step not computed yet
+POLL_INTERVAL = 0.02
+
+
+class Run:
+    """
+    Model run computed in a background thread,
+    keeping the visualization state message and a copy of the households of every step
+    """
+
+    def __init__(self, server: 'RunAheadServer', model_params: Dict, previous: Optional['Run'] = None):
+        """
+        Start the run
+        :param server:          Server whose visualization elements render the steps
+        :param model_params:    Parameters of the model
+        :param previous:        Run of the previous reset, cancelled and awaited before starting
+                                since visualization elements keep the state of their last render
+        """
+        self.server = server
+        self.model_params = model_params
+        self.model = None
+        # viz_state message of every step, as json
+        self.messages: List[str] = []
+        self.households = []
+        self.done = False
+        self.cancelled = False
+        if previous is not None:
+            previous.cancelled = True
+        self.thread = threading.Thread(target=self.run, args=(previous,), daemon=True)
+        self.thread.start()
+
+    def run(self, previous: Optional['Run']):
+        if previous is not None:
+            previous.thread.join()
+        try:
+            model = self.server.model_cls(**self.model_params)
+            model.running = True
+            self.model = model
+            self.add_step()
+            while model.running and model.schedule.steps < self.server.max_steps and not self.cancelled:
+                steps = model.schedule.steps
+                model.step()
+                if model.schedule.steps == steps:
+                    # the model ended without a step, e.g. a ReplayModel of a single step run
+                    break
+                self.add_step()
+        finally:
+            # e.g. the output files of a run cancelled by a reset, see IGAD.close
+            close = getattr(self.model, 'close', None)
+            if close is not None:
+                close()
+            self.done = True
+
+    def add_step(self):
+        """
+        render the current step of the model
+        """
+        data = [element.render(self.model) for element in self.server.visualization_elements]
+        self.households.append(self.model.households.copy())
+        self.messages.append(json.dumps({"type": "viz_state", "data": data}))
+
+    async def get_message(self, step: int) -> Optional[str]:
+        """
+        message of step, waiting for it to be computed.
+        Returns None if the run ended before step
+        """
+        while step >= len(self.messages) and not self.done:
+            await tornado.gen.sleep(POLL_INTERVAL)
+        if step < len(self.messages):
+            return self.messages[step]
+        return None
+
+
+class RunAheadSocketHandler(SocketHandler):
+    """
+    Websocket sending the buffered steps of the server run.
+    Besides the ModularServer messages, "seek" sends every step up to the given one,
+    to be rendered in order by the browser after resetting the elements
+    """
+
+    async def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        if msg["type"] in ("get_step", "seek") and self.application.run is None:
+            self.application.reset_model()
+        if msg["type"] == "get_step":
+            run = self.application.run
+            state = await run.get_message(msg["step"])
+            if run is not self.application.run:
+                # reset while waiting
+                return
+            self.write_message(state if state is not None else {"type": "end"})
+        elif msg["type"] == "reset":
+            self.application.reset_model()
+            run = self.application.run
+            state = await run.get_message(0)
+            if state is not None and run is self.application.run:
+                self.write_message(state)
+        elif msg["type"] == "seek":
+            run = self.application.run
+            await run.get_message(msg["step"])
+            if run is not self.application.run:
+                return
+            for state in run.messages[:msg["step"] + 1]:
+                self.write_message(state)
+        else:
+            super().on_message(message)
+
+
+class RunAheadServer(mesa.visualization.ModularServer):
+    """
+    ModularServer computing the run in a background thread at every reset,
+    the websocket only sends the buffered steps.
+    No run is started until the first reset of a browser
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.run = None
+        # the ModularServer constructor resets the model
+        self._constructed = False
+        super().__init__(*args, **kwargs)
+        self._constructed = True
+        # rules added after the ModularServer ones are matched first
+        self.add_handlers(r".*", [(r"/ws", RunAheadSocketHandler)])
+
+    @property
+    def model(self):
+        """
+        model of the current run, None until it is created
+        """
+        if self.run is None:
+            return None
+        return self.run.model
+
+    def reset_model(self):
+        """
+        Start a new run with the current parameters, cancelling the previous one
+        """
+        if not self._constructed:
+            return
+        model_params = {}
+        for key, val in self.model_kwargs.items():
+            if is_user_param(val):
+                if val.param_type == "static_text":
+                    # static_text is never used for setting params
+                    continue
+                model_params[key] = val.value
+            else:
+                model_params[key] = val
+        self.run = Run(self, model_params, previous=self.run)
+
+    def get_household_description(self, index: int, step: Optional[int] = None) -> Optional[Dict]:
+        """
+        description of household index at the given step of the current run,
+        or at its last computed step, read from the buffer and not from the model being run
+        """
+        run = self.run
+        if run is None or not run.households:
+            return None
+        if step is None:
+            step = len(run.households) - 1
+        if not 0 <= step < len(run.households) or index >= len(run.model.agents):
+            return None
+        return {
+            'id': run.model.agents[index].unique_id,
+            **run.households[step].get_description(index),
+        }
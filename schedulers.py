@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import mesa
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def get_thread_pool(n_threads: int) -> ThreadPoolExecutor:
+    """
+    Returns the thread pool shared by the models running with n_threads, created on first use:
+    models are created at every reset and run, their threads would never be shut down
+    """
+    return ThreadPoolExecutor(n_threads)
+
+
+class IGADStagedActivation(mesa.time.StagedActivation):
+    """
+    StagedActivation only activating, at each stage, the households
+    eligible for it (see Households.get_eligible), measured by the model profiler.
+    Agents are shuffled as in StagedActivation and the households not eligible
+    would return immediately, so activation order and results are the same.
+    In a quiescent year (see IGAD.quiescent) the stages are run in bulk
+    by Households.run_quiescent where possible, agents are still shuffled
+    after every stage to keep the same random sequence.
+    """
+
+    def step(self):
+        """Executes all the stages for the eligible agents."""
+        profiler = self.model.profiler
+        households = self.model.households
+        # households are added in order, agent i is self.model.agents[i]
+        agents = self.model.agents
+        quiescent = self.model.quiescent
+        agent_indices = list(range(len(agents)))
+        if self.shuffle:
+            self.model.random.shuffle(agent_indices)
+        for stage in self.stage_list:
+            if quiescent:
+                with profiler.measure(f'stage.{stage}'):
+                    done = households.run_quiescent(stage)
+                if done:
+                    agent_indices = self.next_order(len(agents))
+                    continue
+
+            # agents read the neighbour counters, not updated by the quiescent years kernels
+            households.refresh_neighbour_counts()
+            eligible = households.get_eligible(stage)
+            if eligible is not None:
+                order = np.array(agent_indices, dtype=np.int64)
+                selected = order[eligible[order]].tolist()
+            else:
+                selected = agent_indices
+
+            with profiler.measure(f'stage.{stage}', calls=len(selected)):
+                for index in selected:
+                    getattr(agents[index], stage)()  # Run stage
+
+            agent_indices = self.next_order(len(agents))
+
+        self.steps += 1
+
+    def next_order(self, n_agents):
+        """
+        activation order of the next stage
+        """
+        agent_indices = list(range(n_agents))
+        if self.shuffle_between_stages:
+            self.model.random.shuffle(agent_indices)
+        self.time += self.stage_time
+        return agent_indices
+
+
+class VectorizedStagedActivation(mesa.time.StagedActivation):
+    """
+    Staged activation running every stage as a single vectorized kernel
+    over the model Households instead of calling each agent.
+    Updates are synchronous: the stages reading the neighbours see the state
+    at the beginning of the stage, so the results don't depend on any activation order.
+    With n_threads > 1 each stage is run on n_threads chunks of households in a thread pool,
+    reading the neighbours from a snapshot taken before the stage, with the same results.
+    In a quiescent year (see IGAD.quiescent) the stages which can't change
+    any household are skipped.
+    """
+
+    def __init__(self, model, stage_list=None, n_threads=1):
+        super().__init__(model, stage_list=stage_list)
+        self.n_threads = n_threads
+        self.pool = get_thread_pool(n_threads) if n_threads > 1 else None
+
+    def step(self):
+        """Executes all the stages for all households."""
+        profiler = self.model.profiler
+        households = self.model.households
+        quiescent = self.model.quiescent
+        for stage in self.stage_list:
+            with profiler.measure(f'stage.{stage}'):
+                if quiescent and households.run_quiescent(stage):
+                    pass
+                elif self.pool is None:
+                    getattr(households, stage)()
+                else:
+                    self.run_chunks(stage)
+            self.time += self.stage_time
+        self.steps += 1
+
+    def run_chunks(self, stage):
+        """
+        run the kernel of stage on views of n_threads chunks of the households
+        """
+        households = self.model.households
+        snapshot = households.get_neighbour_snapshot(stage)
+        bounds = np.linspace(0, len(households), self.n_threads + 1).astype(int)
+        views = [
+            households.view(slice(start, stop), snapshot)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        # list raises the exceptions of the threads
+        list(self.pool.map(lambda view: getattr(view, stage)(), views))
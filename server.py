@@ -1,41 +1,43 @@
 
 import numpy as np
-from typing import Tuple
 
 import mesa
-from agents import (STATUS_DISPLACED, STATUS_EVACUATED, STATUS_NORMAL,
-                    STATUS_TRAPPED, HouseholdAgent)
-from constants import POVERTY_LINE
-from model import IGAD, VILLAGES
+from agents import HouseholdAgent
+from constants import POVERTY_LINE, Status
+from model import IGAD
+from output import find_runs
+from replay import ReplayModel
+from run_ahead import RunAheadServer
 
 from visualizers.stacked_bar_chart import StackedBarChartModule
 from visualizers.grid_layout import GridLayoutModule
-from visualizers.map_module import MapModulePatched
-from spaces import IGADCell
-from utils import SCENARIOS
+from visualizers.playback import PlaybackModule
+from visualizers.map_module import HOUSEHOLD_URL, HouseholdHandler, MapModulePatched
+from utils import MAX_YEARS, SCENARIOS, get_villages
 
 
-def portrayal(element: IGADCell|HouseholdAgent) -> dict|Tuple[float, float, float, float]:
-    if isinstance(element, HouseholdAgent):
-        return households_draw(element)
-    elif isinstance(element, IGADCell):
-        return cell_portrayal(element)
+def portrayal(agent: HouseholdAgent) -> dict:
+    if isinstance(agent, HouseholdAgent):
+        return households_draw(agent)
     else:
         raise ValueError("Unknown element type")
 
-def cell_portrayal(cell: IGADCell) -> Tuple[float, float, float, float]:
-    if cell.water_level == 0:
-        return (0, 0, 0, 0)
-    else:
-        # return a blue color gradient based on the normalized water level
-        # from the lowest water level colored as RGBA: (74, 141, 255, 1)
-        # to the highest water level colored as RGBA: (0, 0, 255, 1)
-        return (
-            (1 - cell.water_level/1000) * 74,
-            (1 - cell.water_level/1000) * 141,
-            255,
-            cell.water_level / 1000,
-        )
+def water_level_colormap(water_level: np.ndarray) -> np.ndarray:
+    """
+    RGBA values of the water level raster, as an array of shape (4, height, width).
+    Dry cells are transparent, flooded cells are colored with a blue gradient
+    based on the normalized water level
+    from the lowest water level colored as RGBA: (74, 141, 255, 1)
+    to the highest water level colored as RGBA: (0, 0, 255, 1)
+    """
+    level = water_level.astype(np.float64) / 1000
+    flooded = water_level != 0
+    values = np.zeros((4, *water_level.shape))
+    values[0][flooded] = (1 - level[flooded]) * 74
+    values[1][flooded] = (1 - level[flooded]) * 141
+    values[2][flooded] = 255
+    values[3][flooded] = level[flooded]
+    return values
 
 def households_draw(agent):
     """
@@ -46,16 +48,16 @@ def households_draw(agent):
         return portrayal
     
 
-    if agent.status == STATUS_NORMAL:
+    if agent.status == Status.NORMAL:
         portrayal["fillColor"] = "Green"
         portrayal["fillOpacity"] = "0.5"
-    elif agent.status == STATUS_DISPLACED:
+    elif agent.status == Status.DISPLACED:
         portrayal["fillColor"] = "Black"
         portrayal["fillOpacity"] = "0.5"        
-    elif agent.status == STATUS_EVACUATED:
+    elif agent.status == Status.EVACUATED:
         portrayal["fillColor"] = "Red"
         portrayal["fillOpacity"] = "0.5"
-    elif agent.status == STATUS_TRAPPED:
+    elif agent.status == Status.TRAPPED:
         portrayal["fillColor"] = "Yellow"
         portrayal["fillOpacity"] = "0.5"
 
@@ -84,16 +86,34 @@ def households_draw(agent):
 
     portrayal["dashArray"] = f"{house_not_damaged}, {house_damage}, {livelihood_not_damaged}, {livelihood_damage}"
 
-
     #"Shape": Can be either "circle", "rect", "arrowHead"
-    portrayal["description"] = agent.get_description()
+    # the description is requested by the map popups, see HouseholdHandler
 
     return portrayal
 
 
 
+# replay_run choice running the model
+NO_REPLAY = "None, run the model"
+
+
+def create_model(replay_run=NO_REPLAY, **kwargs):
+    """
+    IGAD model with the parameters of the interface,
+    or the replay of the saved run selected in replay_run (see replay.py)
+    """
+    if replay_run != NO_REPLAY:
+        return ReplayModel(replay_run)
+    return IGAD(**kwargs)
+
+
 model_params = dict(
-    save_to_csv=mesa.visualization.Checkbox("Save to CSV", True),
+    replay_run=mesa.visualization.Choice("Replay saved run", NO_REPLAY, [NO_REPLAY] + find_runs()),
+    # runs are computed at every reset, output is only saved on request
+    save_to_csv=mesa.visualization.Checkbox("Save to CSV", False),
+    stream_output=mesa.visualization.Checkbox("Stream output", False),
+    vectorized=mesa.visualization.Checkbox("Vectorized engine", False),
+    seed=mesa.visualization.NumberInput("Random Seed", 0),
     
     _separator_1=mesa.visualization.StaticText("_______________________________"),
     _model_params=mesa.visualization.StaticText("Model Parameters"),    
@@ -113,15 +133,20 @@ model_params = dict(
     _active_villages=mesa.visualization.StaticText("Active Villages"),
     ** {
         f'village_{n}': mesa.visualization.Checkbox(f"{village_name}", True) 
-        for n, village_name in enumerate(VILLAGES)
+        for n, village_name in enumerate(get_villages())
     }
     
 )
 
+# households attributes read by households_draw
+PORTRAYAL_FIELDS = ['status', 'income', 'house_damage', 'livelihood_damage']
+
 map_element = MapModulePatched(
     portrayal,
     map_width=350,
     map_height=900,
+    portrayal_fields=PORTRAYAL_FIELDS,
+    raster_colormap=water_level_colormap,
 )
 
 chart_status = StackedBarChartModule([
@@ -229,9 +254,14 @@ gridParams = {
 }
 
 
-server = mesa.visualization.ModularServer(
-    IGAD,
-    [GridLayoutModule(gridParams), map_element, chart_status, chart_affected, chart_stats, chart_displacement],
+# the run is computed in background at every reset of a browser, which plays its buffered steps
+server = RunAheadServer(
+    create_model,
+    [
+        GridLayoutModule(gridParams), map_element, chart_status, chart_affected, chart_stats, chart_displacement,
+        PlaybackModule(MAX_YEARS),
+    ],
     "Agent-based IGAD model",
     model_params,
 )
+server.add_handlers(r".*", [(HOUSEHOLD_URL, HouseholdHandler)])
@@ -4,24 +4,169 @@ import mesa
 import numpy as np
 import mesa_geo as mg
 import rasterio as rio
-from typing import List
+from functools import lru_cache
+from mesa_geo.raster_layers import RasterBase
+from typing import List, Tuple
 
 
 class IGADCell(mg.Cell):
-    water_level: float | None
+    """
+    Cell of a WaterLevelLayer, reading its water level from the layer array
+    """
 
     def __init__(
         self,
         pos: mesa.space.Coordinate | None = None,
         indices: mesa.space.Coordinate | None = None,
+        layer: WaterLevelLayer | None = None,
     ):
         super().__init__(pos, indices)
-        self.water_level = None
+        self.layer = layer
+
+    @property
+    def water_level(self) -> float | None:
+        if self.layer is None:
+            return None
+        row, col = self.indices
+        return self.layer.water_level[row, col]
 
     def step(self):
         pass
 
 
+@lru_cache(maxsize=None)
+def read_grid(raster_file: str) -> tuple:
+    """
+    Returns the width, height, crs, total bounds and transform of a raster file,
+    read once and shared by all the layers created from the same file
+    """
+    with rio.open(raster_file, "r") as dataset:
+        total_bounds = (
+            dataset.bounds.left,
+            dataset.bounds.bottom,
+            dataset.bounds.right,
+            dataset.bounds.top,
+        )
+        return dataset.width, dataset.height, dataset.crs, total_bounds, dataset.transform
+
+
+def read_water_level(event_files: List[str]) -> np.ndarray:
+    """
+    Read the maximum water level for all events
+    """
+    flood_data = None
+    for event_file in event_files:
+        with rio.open(event_file) as f:
+            if flood_data is None:
+                flood_data = f.read(1)
+            else:
+                flood_data = np.maximum(flood_data, f.read(1))
+    return flood_data
+
+
+class WaterLevelLayer(mg.RasterLayer):
+    """
+    Raster layer storing the water level as a single (height, width) array.
+    Cells are only created when they are accessed, e.g. by the visualization.
+    version is incremented every time the water level changes.
+    """
+
+    def __init__(self, width, height, crs, total_bounds, cell_cls: type[IGADCell] = IGADCell):
+        RasterBase.__init__(self, width, height, crs, total_bounds)
+        self.cell_cls = cell_cls
+        self._dry = np.zeros(shape=(height, width))
+        self._water_level = self._dry
+        self._event_files = None
+        # event files of the current water level, None if it isn't read from files
+        self._files = None
+        self.version = 0
+        self._cells = None
+        self._attributes = {"water_level"}
+        self._neighborhood_cache = {}
+        # Profiler measuring the raster reads, set by the model
+        self.profiler = None
+
+    @property
+    def water_level(self) -> np.ndarray:
+        if self._event_files is not None:
+            if self.profiler is not None:
+                with self.profiler.measure('read_water_level', calls=len(self._event_files)):
+                    self._water_level = read_water_level(self._event_files)
+            else:
+                self._water_level = read_water_level(self._event_files)
+            self._event_files = None
+        return self._water_level
+
+    @water_level.setter
+    def water_level(self, water_level: np.ndarray) -> None:
+        self._water_level = water_level
+        self._event_files = None
+        self._files = None
+        self.version += 1
+
+    def load(self, event_files: List[str]) -> None:
+        """
+        Set the water level to the maximum of the event rasters,
+        files are only read when the water level is accessed
+        """
+        event_files = list(event_files)
+        if event_files == self._files:
+            return
+        self._event_files = event_files
+        self._files = event_files
+        self.version += 1
+
+    def reset(self) -> None:
+        """
+        Set the water level to 0
+        """
+        if self._files is None and self._water_level is self._dry:
+            return
+        self.water_level = self._dry
+
+    @property
+    def cells(self) -> list[list[IGADCell]]:
+        if self._cells is None:
+            self._cells = [
+                [
+                    self.cell_cls(pos=(x, y), indices=(self.height - y - 1, x), layer=self)
+                    for y in range(self.height)
+                ]
+                for x in range(self.width)
+            ]
+        return self._cells
+
+    def get_value(self, pos: mesa.space.Coordinate) -> float:
+        """water level of the cell at pos, same as self[pos].water_level"""
+        x, y = pos
+        return self.water_level[self.height - y - 1, x]
+
+    def apply_raster(self, data: np.ndarray, attr_name: str | None = None) -> None:
+        if attr_name != "water_level":
+            return super().apply_raster(data, attr_name)
+        if data.shape != (1, self.height, self.width):
+            raise ValueError(
+                f"Data shape does not match raster shape. "
+                f"Expected {(1, self.height, self.width)}, received {data.shape}."
+            )
+        self.water_level = data[0]
+
+    def get_raster(self, attr_name: str | None = None) -> np.ndarray:
+        if attr_name not in (None, "water_level"):
+            return super().get_raster(attr_name)
+        return np.expand_dims(self.water_level, axis=0)
+
+    @classmethod
+    def from_file(cls, raster_file: str, cell_cls: type[IGADCell] = IGADCell, attr_name: str | None = None) -> WaterLevelLayer:
+        """
+        Creates an empty layer with the grid of a raster file, water level is set to 0
+        """
+        width, height, crs, total_bounds, transform = read_grid(raster_file)
+        obj = cls(width, height, crs, list(total_bounds), cell_cls)
+        obj._transform = transform
+        return obj
+
+
 class IGADSpace(mg.GeoSpace):
     """
     Space for the IGAD model
@@ -37,58 +182,55 @@ class IGADSpace(mg.GeoSpace):
         Initialize the water level of the space using the first event as reference
         waterl_level is set to 0 for all cells
         """
-        raster_layer = mg.RasterLayer.from_file(
-            event_file, cell_cls=IGADCell, attr_name="water_level"
-        )
+        raster_layer = WaterLevelLayer.from_file(event_file)
         raster_layer.crs = 'epsg:4326'
-        raster_layer.apply_raster(
-            data=np.zeros(shape=(1, raster_layer.height, raster_layer.width)),
-            attr_name="water_level",
-        )
         super().add_layer(raster_layer)
 
+    def get_position(self, x: float, y: float) -> mesa.space.Coordinate:
+        """
+        position of the cell containing the point (x, y)
+        """
+        i, j = (x, y) * ~self.raster_layer.transform
+        return round(i), round(j)
+
+    def get_positions(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        positions of the cells containing the points (xs[i], ys[i])
+        """
+        i, j = ~self.raster_layer.transform * (np.asarray(xs), np.asarray(ys))
+        return np.rint(i).astype(np.int64), np.rint(j).astype(np.int64)
+
     def get_water_level(self, agent: mg.GeoAgent):
         """check space for flood"""
         if agent in self._agents_positions:
             pos = self._agents_positions[agent]
         else:
             x, y = agent.geometry.xy
-            i, j = (x[0],y[0]) * ~self.raster_layer.transform
-            pos = round(i), round(j)
+            pos = self.get_position(x[0], y[0])
             self._agents_positions[agent] = pos
-        
-        cell = self.raster_layer[pos]
 
-        return cell.water_level
+        return self.raster_layer.get_value(pos)
+
+    def get_raster_indices(self, positions: Tuple[np.ndarray, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (row, col) indices in the event rasters of the cell positions returned by get_positions
+        """
+        xs, ys = positions
+        return self.raster_layer.height - ys - 1, xs
 
     def reset_water_level(self):
         """
         Reset the water level of the space to 0
         """
-        self.raster_layer.apply_raster(
-            data=np.zeros(shape=(1, self.raster_layer.height, self.raster_layer.width)),
-            attr_name="water_level",
-        )
+        self.raster_layer.reset()
 
     def update_water_level(self, event_files: List[str]):
         """
-        Update the water level of the space using the maximum water level for all events
+        Update the water level of the space using the maximum water level for all events.
+        Rasters are read only if the water level is accessed, e.g. by the visualization:
+        the model reads the household water levels from its HazardTable
         """
-
-        flood_data = None
-        for event_file in event_files:
-            with rio.open(event_file) as f:
-                if flood_data is None:
-                    flood_data = f.read(1)
-                else:
-                    flood_data = np.maximum(flood_data, f.read(1))
-
-        # add dimension to flood_data
-        flood_data = np.expand_dims(flood_data, axis=0)
-
-        self.raster_layer.apply_raster(
-            data=flood_data, attr_name="water_level"
-        )
+        self.raster_layer.load(event_files)
 
     @property
     def raster_layer(self):
@@ -101,5 +243,3 @@ class IGADSpace(mg.GeoSpace):
             or col_idx == 0
             or col_idx == self.raster_layer.width
         )
-
-    
\ No newline at end of file
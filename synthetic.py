@@ -0,0 +1,226 @@
+"""
+Generator of synthetic datasets with the same layout of the IGAD data directory,
+to run the model at any size without the IGAD data. Usage:
+
+    python synthetic.py synthetic --villages 20 --households 100000
+    IGAD_DATA_DIR=synthetic python run.py
+"""
+import argparse
+import os
+from typing import List
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio as rio
+import shapely
+
+from constants import MATERIALS
+
+# same return periods of the IGAD hazard maps
+RETURN_PERIODS = [1, 2, 5, 10, 25, 50, 100, 200, 250]
+MIN_RETURN_PERIODS = 2
+MAX_RETURN_PERIOD = 250
+AWARENESS_COLUMNS = [
+    'floods_changed_frequency',
+    'floods_changed_intensity',
+    'floods_changed_predictability',
+    'floods_changed_future_frequency',
+    'behaviour_affects_flood_impact'
+]
+CURVES = ['M', 'C', 'W', 'T', 'R']
+# size of a raster cell in degrees, about 30m
+PIXEL_SIZE = 0.00027
+# fraction of the raster cells with a household
+HOUSEHOLDS_DENSITY = 0.05
+# number of survey answers for each village
+SURVEY_SIZE = 60
+
+
+def get_return_periods(n_return_periods: int) -> List[int]:
+    """
+    Returns n_return_periods distinct return periods, from 1 to at most MAX_RETURN_PERIOD years as the IGAD maps.
+    At least 2 are needed, events of 1 year return period are not in the calendar
+    """
+    if not MIN_RETURN_PERIODS <= n_return_periods <= MAX_RETURN_PERIOD:
+        raise ValueError(
+            f'number of return periods must be between {MIN_RETURN_PERIODS} and {MAX_RETURN_PERIOD}, '
+            f'got {n_return_periods}'
+        )
+    if n_return_periods <= len(RETURN_PERIODS):
+        return RETURN_PERIODS[:n_return_periods]
+    # evenly spaced on a log scale, rounded periods equal to the previous one are moved to the next year
+    return_periods = []
+    for return_period in np.round(np.geomspace(1, MAX_RETURN_PERIOD, n_return_periods)).astype(int):
+        if return_periods:
+            return_period = max(return_period, return_periods[-1] + 1)
+        return_periods.append(int(return_period))
+    return return_periods
+
+
+def n_return_periods_arg(value: str) -> int:
+    """
+    argparse type of the number of return periods, see get_return_periods
+    """
+    try:
+        n_return_periods = int(value)
+        get_return_periods(n_return_periods)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return n_return_periods
+
+
+def write_hazard_maps(path: str, return_periods: List[int], width: int, height: int, transform):
+    """
+    Write a water level map for each return period,
+    a river crosses the region diagonally and the flooded area grows with the return period
+    """
+    rows, cols = np.mgrid[0:height, 0:width]
+    distance = np.abs(rows - cols * 0.8 - height * 0.1) / np.sqrt(1 + 0.64)
+    for return_period in return_periods:
+        water_level = 1500 * np.log1p(return_period) / np.log1p(250) - distance * 5
+        water_level = np.clip(water_level, 0, None).astype('float32')
+        filename = os.path.join(path, 'Maps', f'SD_30mHazardMap_{return_period:0>4d}_cut.tif')
+        with rio.open(
+            filename, 'w', driver='GTiff', width=width, height=height, count=1,
+            dtype='float32', crs='epsg:4326', transform=transform
+        ) as f:
+            f.write(water_level, 1)
+
+
+def write_settlements(path: str, villages: List[str], n_households: int, bounds, rng):
+    """
+    Write two bounding boxes for each village, flood prone and not,
+    and the settlements inside them
+    """
+    west, south, east, north = bounds
+    n_cols = int(np.ceil(np.sqrt(len(villages))))
+    box_width = (east - west) / n_cols
+    box_height = (north - south) / n_cols
+
+    boxes = []
+    for n, village in enumerate(villages):
+        x, y = west + (n % n_cols) * box_width, north - (n // n_cols) * box_height
+        boxes.append(dict(village=village, floodprone=1, geometry=shapely.box(x, y - box_height / 2, x + box_width, y)))
+        boxes.append(dict(village=village, floodprone=0, geometry=shapely.box(x, y - box_height, x + box_width, y - box_height / 2)))
+    bounding_boxes = gpd.GeoDataFrame(boxes, crs='epsg:4326')
+    os.makedirs(os.path.join(path, 'BoundingBox20022023'), exist_ok=True)
+    bounding_boxes.to_file(os.path.join(path, 'BoundingBox20022023', 'BoundingBox_20022023.shp'))
+
+    # households are spread evenly over the boxes, as small squares
+    n_boxes = len(bounding_boxes)
+    settlements = []
+    for n, bounding_box in enumerate(bounding_boxes.geometry):
+        min_x, min_y, max_x, max_y = bounding_box.bounds
+        size = n_households // n_boxes + (1 if n < n_households % n_boxes else 0)
+        xs = rng.uniform(min_x + PIXEL_SIZE, max_x - PIXEL_SIZE, size)
+        ys = rng.uniform(min_y + PIXEL_SIZE, max_y - PIXEL_SIZE, size)
+        half = PIXEL_SIZE / 4
+        settlements.append(shapely.box(xs - half, ys - half, xs + half, ys + half))
+    gpd.GeoDataFrame(geometry=np.concatenate(settlements), crs='epsg:4326')\
+        .to_file(os.path.join(path, 'settlements_grid_wdst_sampled.gpkg'), driver='GPKG')
+
+
+def write_population_data(path: str, villages: List[str], rng):
+    """
+    Write SURVEY_SIZE random survey answers for each village
+    """
+    n_rows = SURVEY_SIZE * len(villages)
+    df = pd.DataFrame({
+        'village': np.repeat(villages, SURVEY_SIZE),
+        'income': rng.integers(0, 3, n_rows),
+        'vulnerabilities': rng.integers(0, 4, n_rows),
+        'properties': rng.integers(0, 4, n_rows),
+        'walls_materials': [material + ' ' for material in rng.choice(MATERIALS, n_rows)],
+        'fear_of_flood': rng.integers(0, 4, n_rows),
+        'household_size': rng.integers(1, 10, n_rows),
+    })
+    for column in AWARENESS_COLUMNS:
+        values = rng.integers(0, 4, n_rows).astype(object)
+        # unknown answers
+        values[rng.random(n_rows) < 0.1] = 'U'
+        df[column] = values
+    df.to_excel(os.path.join(path, 'population_data.xlsx'), index=False)
+
+
+def write_event_calendar(path: str, return_periods: List[int], n_years: int, rng):
+    """
+    Write a calendar of n_years years, each year has a flood with the highest
+    return period exceeded by a random draw (events of 1 year return period are not listed)
+    """
+    draws = rng.random(n_years)
+    events = []
+    last_year = 0
+    for year, draw in enumerate(draws, 1):
+        exceeded = [return_period for return_period in return_periods[1:] if draw < 1 / return_period]
+        if exceeded:
+            events.append((year, exceeded[-1], year - last_year))
+            last_year = year
+    pd.DataFrame(events, columns=['Year', 'ReturnPeriod', 'InterarrivalTime'])\
+        .to_csv(os.path.join(path, 'SD_EventCalendar.csv'), index=False)
+
+
+def write_curves(path: str):
+    """
+    Write linear damage curves, reaching full damage at increasing water levels
+    """
+    os.makedirs(os.path.join(path, 'curves'), exist_ok=True)
+    water_levels = np.arange(0, 3001, 250)
+    for n, curve in enumerate(CURVES):
+        damage = np.clip(water_levels / (1500 + 300 * n), 0, 1)
+        pd.DataFrame({'water_level': water_levels, 'damage': damage, 'std': 0.05})\
+            .to_csv(os.path.join(path, 'curves', f'{curve}1.csv'), index=False, header=False)
+
+
+def generate(
+    path: str,
+    n_villages: int = 7,
+    n_households: int = 2000,
+    n_return_periods: int = len(RETURN_PERIODS),
+    n_years: int = 1000,
+    seed: int = 0
+):
+    """
+    Write a synthetic dataset to path
+    :param path:                Data directory, to be used as IGAD_DATA_DIR
+    :param n_villages:          Number of villages
+    :param n_households:        Total number of households
+    :param n_return_periods:    Number of hazard maps
+    :param n_years:             Length of the event calendar
+    :param seed:                Seed of the random number generator
+    """
+    rng = np.random.default_rng(seed)
+    villages = [f'Village {n}' for n in range(n_villages)]
+    os.makedirs(os.path.join(path, 'Maps'), exist_ok=True)
+
+    # square region with enough cells for the households
+    width = height = max(int(np.ceil(np.sqrt(n_households / HOUSEHOLDS_DENSITY))), 200)
+    west, north = 32.5, 15.6
+    bounds = (west, north - height * PIXEL_SIZE, west + width * PIXEL_SIZE, north)
+    transform = rio.transform.from_bounds(*bounds, width, height)
+
+    return_periods = get_return_periods(n_return_periods)
+    write_hazard_maps(path, return_periods, width, height, transform)
+    write_settlements(path, villages, n_households, bounds, rng)
+    with open(os.path.join(path, 'villages.txt'), 'w') as f:
+        f.write('\n'.join(villages) + '\n')
+    write_population_data(path, villages, rng)
+    write_event_calendar(path, return_periods, n_years, rng)
+    write_curves(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic dataset for the IGAD model')
+    parser.add_argument('path', help='output data directory')
+    parser.add_argument('--villages', type=int, default=7, help='number of villages')
+    parser.add_argument('--households', type=int, default=2000, help='total number of households')
+    parser.add_argument('--return-periods', type=n_return_periods_arg, default=len(RETURN_PERIODS), help='number of hazard maps')
+    parser.add_argument('--years', type=int, default=1000, help='length of the event calendar')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random number generator')
+    args = parser.parse_args()
+
+    generate(args.path, args.villages, args.households, args.return_periods, args.years, args.seed)
+
+
+if __name__ == '__main__':
+    main()
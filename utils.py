@@ -1,22 +1,195 @@
+import os
+from functools import lru_cache
+from typing import List
+
+import geopandas as gpd
 import pandas as pd
 import rasterio as rio
 import numpy as np
 
-from constants import (MATERIAL_STONE_BRICKS, MATERIAL_CONCRETE, MATERIAL_WOOD, MATERIAL_MUD_BRICKS, MATERIAL_INFORMAL_SETTLEMENTS)
+from cache import get_cache_path, get_file_key, get_key, load_arrays, load_cached, save_arrays
+
+from constants import (MATERIAL_STONE_BRICKS, MATERIAL_CONCRETE, MATERIAL_WOOD, MATERIAL_MUD_BRICKS, MATERIAL_INFORMAL_SETTLEMENTS, MATERIALS)
+
+# directory of the input data, can be overridden by environment (e.g. a synthetic.py dataset)
+DEFAULT_DATA_DIR = 'IGAD'
+DATA_DIR = os.environ.get('IGAD_DATA_DIR', DEFAULT_DATA_DIR)
+
+MAPS_BASENAME = f'{DATA_DIR}/Maps/SD_30mHazardMap'
+EVENTS_FILE = f'{DATA_DIR}/SD_EventCalendar.csv'
+POPULATION_FILE = f'{DATA_DIR}/population_data.xlsx'
+SETTLEMENTS_FILE = f'{DATA_DIR}/settlements_grid_wdst_sampled.gpkg'
+BOUNDING_BOXES_FILE = f'{DATA_DIR}/BoundingBox20022023/BoundingBox_20022023.shp'
+# villages of a dataset, one per line, written by synthetic.py
+VILLAGES_FILE = f'{DATA_DIR}/villages.txt'
+CURVES_FILES = {
+    'M': f'{DATA_DIR}/curves/M1.csv',
+    'C': f'{DATA_DIR}/curves/C1.csv',
+    'W': f'{DATA_DIR}/curves/W1.csv',
+    'T': f'{DATA_DIR}/curves/T1.csv',
+    'R': f'{DATA_DIR}/curves/R1.csv',
+}
 
-MAPS_BASENAME = 'IGAD/Maps/SD_30mHazardMap'
+# villages of the IGAD data, village_<n> is the n-th
+VILLAGES = [
+    'Al-Gaili', 
+    'Wawise Garb', 
+    'Wad Ramli Camp', 
+    'Eltomaniat', 
+    'Al-Shuhada', 
+    'Wawise Oum Ojaija', 
+    'Wad Ramli'
+]
 
-DF_EVENTS = pd.read_csv('IGAD/SD_EventCalendar.csv').query('ReturnPeriod < 273')
 SCENARIOS = ['Low Hazard', 'Medium Hazard', 'High Hazard', 'Very High Hazard', 'Extreme Hazard']
 MAX_YEARS = 30
-# read curves from file, first columns is the index, second column is the value
-CURVES = {
-    'M': pd.read_csv('IGAD/curves/M1.csv', index_col=0, header=None, names=['damage', 'std']),
-    'C': pd.read_csv('IGAD/curves/C1.csv', index_col=0, header=None, names=['damage', 'std']),
-    'W': pd.read_csv('IGAD/curves/W1.csv', index_col=0, header=None, names=['damage', 'std']),
-    'T': pd.read_csv('IGAD/curves/T1.csv', index_col=0, header=None, names=['damage', 'std']),
-    'R': pd.read_csv('IGAD/curves/R1.csv', index_col=0, header=None, names=['damage', 'std'])
+# curve used for each house material
+MATERIAL_CURVES = {
+    MATERIAL_STONE_BRICKS: 'M',
+    MATERIAL_CONCRETE: 'C',
+    MATERIAL_WOOD: 'W',
+    MATERIAL_INFORMAL_SETTLEMENTS: 'R',
+    MATERIAL_MUD_BRICKS: 'T',
 }
+MATERIAL_CODES = {material: code for code, material in enumerate(MATERIALS)}
+
+# Input data are read on first use and cached in CACHE_DIR,
+# cache files are rebuilt when the source files change
+
+@lru_cache(maxsize=None)
+def get_event_calendar() -> pd.DataFrame:
+    """
+    Returns the event calendar
+    """
+    return load_cached(
+        'events', [EVENTS_FILE],
+        lambda: pd.read_csv(EVENTS_FILE).query('ReturnPeriod < 273')
+    )
+
+
+@lru_cache(maxsize=None)
+def get_curves() -> dict:
+    """
+    Returns the damage curves, the index is the flood value and damage column is the damage
+    """
+    # read curves from file, first columns is the index, second column is the value
+    return load_cached(
+        'curves', list(CURVES_FILES.values()),
+        lambda: {
+            name: pd.read_csv(filename, index_col=0, header=None, names=['damage', 'std'])
+            for name, filename in CURVES_FILES.items()
+        }
+    )
+
+
+@lru_cache(maxsize=None)
+def get_damage_curves() -> list:
+    """
+    Returns the (flood values, damages) arrays of the curve of each material code
+    """
+    curves = get_curves()
+    return [
+        (curves[MATERIAL_CURVES[material]].index.values, curves[MATERIAL_CURVES[material]]['damage'].values)
+        for material in MATERIALS
+    ]
+
+
+@lru_cache(maxsize=None)
+def get_scenarios() -> pd.DataFrame:
+    """
+    Returns the scenarios generated from the event calendar, see generate_scenarios
+    """
+    return load_cached('scenarios', [EVENTS_FILE], generate_scenarios)
+
+
+@lru_cache(maxsize=None)
+def get_population_data() -> pd.DataFrame:
+    """
+    Returns the population data, see load_population_data
+    """
+    return load_cached('population', [POPULATION_FILE], load_population_data)
+
+
+@lru_cache(maxsize=None)
+def get_settlements() -> gpd.GeoDataFrame:
+    """
+    Returns the settlements in epsg:4326
+    """
+    return load_cached(
+        'settlements', [SETTLEMENTS_FILE],
+        lambda: gpd.read_file(SETTLEMENTS_FILE).to_crs(epsg=4326)
+    )
+
+
+@lru_cache(maxsize=None)
+def get_bounding_boxes() -> gpd.GeoDataFrame:
+    """
+    Returns the bounding boxes of the villages in epsg:4326
+    """
+    return load_cached(
+        'bounding_boxes', [BOUNDING_BOXES_FILE],
+        lambda: gpd.read_file(BOUNDING_BOXES_FILE).to_crs(epsg=4326)
+    )
+
+
+@lru_cache(maxsize=None)
+def get_settlement_assignment() -> dict:
+    """
+    Returns the settlements within each bounding box as arrays, see assign_settlements.
+    The assignment is cached and rebuilt when the settlements or bounding boxes files change
+    """
+    filenames = [SETTLEMENTS_FILE, BOUNDING_BOXES_FILE]
+    path = get_cache_path('assignment', get_key(*filenames))
+    checksum = get_file_key(*filenames)
+
+    arrays = load_arrays(path, checksum)
+    if arrays is None:
+        arrays = assign_settlements(get_settlements(), get_bounding_boxes())
+        save_arrays(path, checksum, **arrays)
+    return arrays
+
+
+def get_villages() -> List[str]:
+    """
+    Returns the villages of the dataset: the ones in VILLAGES_FILE if it exists,
+    VILLAGES for the IGAD data, otherwise the villages of the bounding boxes in order of appearance
+    """
+    if os.path.exists(VILLAGES_FILE):
+        with open(VILLAGES_FILE) as f:
+            return [line.strip() for line in f if line.strip()]
+    if DATA_DIR == DEFAULT_DATA_DIR:
+        return list(VILLAGES)
+    box_village = get_settlement_assignment()['box_village']
+    _, first = np.unique(box_village, return_index=True)
+    return box_village[np.sort(first)].tolist()
+
+
+def assign_settlements(settlements: gpd.GeoDataFrame, bounding_boxes: gpd.GeoDataFrame) -> dict:
+    """
+    Assign the settlements to the bounding boxes containing them with a single spatial join.
+    Returns a dictionary of arrays:
+    - box_village, box_flood_prone: village and flood prone flag of each bounding box
+    - box, x, y: bounding box and centroid of each (settlement, bounding box) pair,
+      sorted by bounding box and then by settlement
+    """
+    settlements = settlements[['geometry']].reset_index(drop=True)
+    bounding_boxes = bounding_boxes.reset_index(drop=True)
+    joined = gpd.sjoin(settlements, bounding_boxes[['geometry']], how='inner', predicate='within')
+
+    settlement = joined.index.values
+    box = joined['index_right'].values
+    order = np.lexsort((settlement, box))
+    settlement, box = settlement[order], box[order]
+
+    centroids = settlements.geometry.centroid
+    return dict(
+        box_village=bounding_boxes['village'].values.astype(str),
+        box_flood_prone=(bounding_boxes['floodprone'] == 1).values,
+        box=box.astype(np.int64),
+        x=centroids.x.values[settlement],
+        y=centroids.y.values[settlement],
+    )
+
 
 def generate_scenarios():
     """
@@ -29,13 +202,14 @@ def generate_scenarios():
     - Extreme Hazard: maximium ranking group
     """
     # iterate rows
+    df_events = get_event_calendar()
     groups = []
     last_start_year = None
     max_return_period = 0
     sum_return_period = 0
     n_events = 0
-    for i in range(DF_EVENTS.shape[0]):
-        row = DF_EVENTS.iloc[i]
+    for i in range(df_events.shape[0]):
+        row = df_events.iloc[i]
 
         year = row['Year']
         if last_start_year is None:
@@ -69,12 +243,15 @@ def generate_scenarios():
 
 
 
+@lru_cache(maxsize=None)
 def get_events(start_year, end_year):
     """
-    Returns a dictionary of events, where the key is the relative year and the value is a list of events
+    Returns a dictionary of events, where the key is the relative year and the value is a list of events.
+    The dictionary is shared by all the models of the scenario, and it is not modified
     """
     events = {}
-    df_floods = DF_EVENTS.query(
+    df_events = get_event_calendar()
+    df_floods = df_events.query(
         'Year >= @start_year and Year <= @end_year')
 
     for year, group in df_floods.groupby('Year'):
@@ -94,7 +271,7 @@ def get_events(start_year, end_year):
 
 
 def load_population_data() -> pd.DataFrame:
-    df = pd.read_excel('IGAD/population_data.xlsx')
+    df = pd.read_excel(POPULATION_FILE)
     awareness_columns = [
         'floods_changed_frequency', 
         'floods_changed_intensity', 
@@ -104,7 +281,6 @@ def load_population_data() -> pd.DataFrame:
 
     ]
     df['fear_of_flood'] = df['fear_of_flood'] / 3
-    df['income'] = df['income'].apply(lambda x: (x + np.random.random())**1.3)
     # remove U from awareness columns
     df[awareness_columns] = df[awareness_columns].replace('U', np.NaN)
     df['awareness'] = df[awareness_columns].mean(axis=1) / 3
@@ -125,44 +301,70 @@ def load_population_data() -> pd.DataFrame:
         'awareness',
         'obstacles_to_movement',
     ]]
-    df.fillna(0, inplace=True)
+    # missing incomes are set to 0 by get_incomes
+    df = df.fillna({column: 0 for column in df.columns if column != 'income'})
     return df
 
+def get_incomes(incomes, rng):
+    """
+    Returns the household incomes from the income classes of the population data
+    @param incomes: income classes
+    @param rng: random number generator of the model
+    """
+    return np.nan_to_num((incomes + rng.random(len(incomes)))**1.3)
+
+
 def get_damage(value, material):
     """
-    Returns the damage value for a given flood value and material
+    Returns the damage value for a given flood value and material,
+    same as get_damages for a single household
     @param value: flood value
     @param material: material
     """
     if value <= 0:
-        return 0
-    
-    curve = None
-    if material == MATERIAL_STONE_BRICKS:
-        curve = CURVES['M']
-    elif material == MATERIAL_CONCRETE:
-        curve = CURVES['C']
-    elif material == MATERIAL_WOOD:
-        curve = CURVES['W']
-    elif material == MATERIAL_INFORMAL_SETTLEMENTS:
-        curve = CURVES['R']
-    elif material == MATERIAL_MUD_BRICKS:
-        curve = CURVES['T']
-
-    if value < curve.index[0]:
-       return 0
-
-    idx = np.searchsorted(curve.index, value, side='left')
+        return 0.0
+
+    curve_values, curve_damages = get_damage_curves()[MATERIAL_CODES[material]]
+    # no damage up to the first value of the curve, last damage after the last one
+    idx = np.searchsorted(curve_values, value, side='left')
     if idx == 0:
-        return 0
-    elif idx == len(curve.index):
-        return curve.iloc[-1]['damage']
-    else:        
-        prev_value, prev_damage = curve.index[idx-1], curve.iloc[idx-1]['damage']
-        next_value, next_damage = curve.index[idx], curve.iloc[idx]['damage']
-        damage = prev_damage + (next_damage - prev_damage) * (value - prev_value) / (next_value - prev_value)
-
-    return damage
-
-DF_SCENARIOS = generate_scenarios()
-print(DF_SCENARIOS)
\ No newline at end of file
+        return 0.0
+    elif idx == len(curve_values):
+        return curve_damages[-1]
+
+    prev_value, prev_damage = curve_values[idx-1], curve_damages[idx-1]
+    next_value, next_damage = curve_values[idx], curve_damages[idx]
+    return prev_damage + (next_damage - prev_damage) * (value - prev_value) / (next_value - prev_value)
+
+
+def get_damages(values, materials):
+    """
+    Returns the damage values for arrays of flood values and material codes
+    using linear interpolation of the damage curves
+    @param values: flood values
+    @param materials: material codes, indices in MATERIALS
+    """
+    values = np.asarray(values)
+    materials = np.asarray(materials)
+    damages = np.zeros(values.shape)
+
+    for code, (curve_values, curve_damages) in enumerate(get_damage_curves()):
+        selected = (materials == code) & ~(values <= 0)
+        if not selected.any():
+            continue
+
+        value = values[selected]
+        # no damage up to the first value of the curve, last damage after the last one
+        idx = np.searchsorted(curve_values, value, side='left')
+        damage = np.zeros(value.shape)
+        damage[idx == len(curve_values)] = curve_damages[-1]
+
+        between = (idx > 0) & (idx < len(curve_values))
+        idx, value = idx[between], value[between]
+        prev_value, prev_damage = curve_values[idx-1], curve_damages[idx-1]
+        next_value, next_damage = curve_values[idx], curve_damages[idx]
+        damage[between] = prev_damage + (next_damage - prev_damage) * (value - prev_value) / (next_value - prev_value)
+
+        damages[selected] = damage
+
+    return damages
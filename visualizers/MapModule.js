@@ -27,39 +27,112 @@ const MapModule = function (view, zoom, map_width, map_height) {
     const osm = new L.TileLayer(osmUrl, {minZoom: 0, maxZoom: 18, attribution: osmAttrib})
     Lmap.addLayer(osm)
 
-    let hasFitBounds = false
-    this.renderLayers = function (layers) {
-        // Remove all layers
-        rasterLayers.forEach(function (layer) {
-            layer.remove()
-        });
-        rasterLayers = [];
-        layers.rasters.forEach(function (layer) {
-            const rasterLayer = L.imageOverlay(layer, layers.total_bounds);
-            rasterLayer.addTo(Lmap);
-            rasterLayers.push(rasterLayer);
-        });
-
-        vectorLayers.forEach(function (layer) {
-            layer.remove()
-        });
-        vectorLayers = [];
-        layers.vectors.forEach(function (layer) {
-            const vectorLayer = L.geoJSON(layer);
-            vectorLayer.addTo(Lmap);
-            vectorLayers.push(vectorLayer);
+    // downsampled image when the overlay is not larger on screen than it
+    const rasterUrl = function (raster) {
+        if (raster.url_low === undefined || !Lmap._loaded) {
+            return raster.url
+        }
+        const overlay = Lmap.latLngToLayerPoint(rasterBounds.getNorthEast()).x -
+            Lmap.latLngToLayerPoint(rasterBounds.getSouthWest()).x
+        return (overlay <= raster.width_low) ? raster.url_low : raster.url
+    }
+
+    let rasterBounds = null
+    let rasters = []
+    let rasterUrls = []
+    Lmap.on('zoomend', function () {
+        rasterLayers.forEach(function (layer, n) {
+            const url = rasterUrl(rasters[n])
+            if (rasterUrls[n] !== url) {
+                layer.setUrl(url)
+                rasterUrls[n] = url
+            }
         })
+    })
 
+    let hasFitBounds = false
+    this.renderLayers = function (layers) {
         if (!hasFitBounds && !customView && layers.total_bounds.length !== 0) {
             Lmap.fitBounds(layers.total_bounds)
             hasFitBounds = true
         }
+
+        // rasters and vectors are only sent when they change
+        if (layers.rasters !== undefined) {
+            rasterLayers.forEach(function (layer) {
+                layer.remove()
+            });
+            rasterLayers = [];
+            rasters = layers.rasters
+            rasterBounds = L.latLngBounds(layers.total_bounds)
+            rasterUrls = rasters.map(rasterUrl)
+            layers.rasters.forEach(function (raster, n) {
+                const rasterLayer = L.imageOverlay(rasterUrls[n], layers.total_bounds);
+                rasterLayer.addTo(Lmap);
+                rasterLayers.push(rasterLayer);
+            });
+        }
+
+        if (layers.vectors !== undefined) {
+            vectorLayers.forEach(function (layer) {
+                layer.remove()
+            });
+            vectorLayers = [];
+            layers.vectors.forEach(function (layer) {
+                const vectorLayer = L.geoJSON(layer);
+                vectorLayer.addTo(Lmap);
+                vectorLayers.push(vectorLayer);
+            })
+        }
     }
 
+    // markers of the households, in the order of the features of the first render
+    let agentMarkers = []
+    // household of the open popup requesting its description
+    let openHousehold = null
+    // step of the last render
+    let step = null
     this.renderAgents = function (agents) {
+        step = agents.step
+        if (agents.features === undefined) {
+            // only the portrayal of the changed households, update their markers in place
+            agents.ids.forEach(function (id, n) {
+                const portrayal = agents.portrayals[n]
+                const marker = agentMarkers[id]
+                marker.setStyle(portrayal.pointToLayer || portrayal.style)
+                if (portrayal.popupProperties) {
+                    marker.setPopupContent(PopUpContent(portrayal.popupProperties))
+                }
+            })
+            if (openHousehold !== null) {
+                PopUpDescription(agentMarkers[openHousehold], openHousehold, step)
+            }
+            return
+        }
+
         agentLayer.remove()
+        agentMarkers = []
+        openHousehold = null
         agentLayer = L.geoJSON(agents, {
-            onEachFeature: PopUpProperties,
+            onEachFeature: function (feature, layer) {
+                const id = agentMarkers.length
+                agentMarkers.push(layer)
+                if (feature.properties.popupProperties) {
+                    PopUpProperties(feature, layer)
+                    return
+                }
+                // description requested when the popup is opened
+                layer.bindPopup(PopUpContent(null))
+                layer.on('popupopen', function () {
+                    openHousehold = id
+                    PopUpDescription(layer, id, step)
+                })
+                layer.on('popupclose', function () {
+                    if (openHousehold === id) {
+                        openHousehold = null
+                    }
+                })
+            },
             style: function (feature) {
                 return feature.properties.style
             },
@@ -76,17 +149,35 @@ const MapModule = function (view, zoom, map_width, map_height) {
 
     this.reset = function () {
         agentLayer.remove()
+        agentMarkers = []
+        openHousehold = null
     }
 }
 
 
-function PopUpProperties(feature, layer) {
+function PopUpContent(popupProperties) {
     let popupContent = '<table>'
-    if (feature.properties.popupProperties) {
-        for (const p in feature.properties.popupProperties) {
-            popupContent += '<tr><td>' + p + '</td><td>' + feature.properties.popupProperties[p] + '</td></tr>'
+    if (popupProperties) {
+        for (const p in popupProperties) {
+            popupContent += '<tr><td>' + p + '</td><td>' + popupProperties[p] + '</td></tr>'
         }
     }
     popupContent += '</table>'
-    layer.bindPopup(popupContent)
+    return popupContent
+}
+
+
+function PopUpDescription(layer, id, step) {
+    fetch('/household/' + id + (step === undefined || step === null ? '' : '?step=' + step))
+        .then(function (response) {
+            return response.json()
+        })
+        .then(function (description) {
+            layer.setPopupContent(PopUpContent(description))
+        })
+}
+
+
+function PopUpProperties(feature, layer) {
+    layer.bindPopup(PopUpContent(feature.properties.popupProperties))
 }
\ No newline at end of file
@@ -0,0 +1,36 @@
+const PlaybackModule = function (max_steps) {
+    // slider in the top bar, to keep the grid layout of the elements
+    const topbar = document.getElementById("elements-topbar");
+    const container = document.createElement("div");
+    const label = document.createElement("label");
+    label.className = "badge bg-primary";
+    label.style.marginRight = "15px";
+    label.innerText = "Seek Step";
+    const slider = document.createElement("input");
+    Object.assign(slider, {type: "range", min: 0, max: max_steps, step: 1, value: 0});
+    container.appendChild(label);
+    container.appendChild(slider);
+    topbar.appendChild(container);
+
+    // render every step up to the selected one, sent by the server from its buffer
+    slider.onchange = function () {
+        controller.stop();
+        clearTimeout(controller.timeout);
+        vizElements.forEach((element) => element.reset());
+        if (controller.finished) {
+            controller.finished = false;
+            startModelButton.firstElementChild.innerText = "Start";
+        }
+        send({type: "seek", step: Number(slider.value)});
+    };
+
+    this.render = function (step) {
+        slider.value = step;
+        controller.tick = step;
+        stepDisplay.innerText = step;
+    };
+
+    this.reset = function () {
+        slider.value = 0;
+    };
+};
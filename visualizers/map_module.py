@@ -1,8 +1,62 @@
-from mesa_geo .visualization import MapModule
+import weakref
+
+import geopandas as gpd
+import numpy as np
+import tornado.web
+from folium.utilities import image_to_url
+from mesa_geo.raster_layers import RasterBase, RasterLayer
+from mesa_geo.visualization import MapModule
+from shapely.geometry import mapping, Point
+
+# largest side in pixels of the downsampled raster images
+LOW_RES_SIZE = 256
+# url of the description of a household, requested by the map popups in MapModule.js
+HOUSEHOLD_URL = r"/household/(\d+)"
+
+
+class HouseholdHandler(tornado.web.RequestHandler):
+    """
+    Description of the household with the given index in model.agents,
+    as returned by get_description.
+    Servers keeping past steps, e.g. RunAheadServer, return it with their
+    get_household_description method, at the step argument or at their last step
+    """
+
+    def get(self, index):
+        index = int(index)
+        step = self.get_argument('step', None)
+        if step is not None:
+            try:
+                step = int(step)
+            except ValueError:
+                raise tornado.web.HTTPError(400, 'step must be an integer')
+            if step < 0:
+                raise tornado.web.HTTPError(400, 'step must not be negative')
+        get_household_description = getattr(self.application, 'get_household_description', None)
+        if get_household_description is not None:
+            description = get_household_description(index, step)
+        else:
+            model = self.application.model
+            agents = [] if model is None else model.agents
+            description = agents[index].get_description() if index < len(agents) else None
+        if description is None:
+            raise tornado.web.HTTPError(404)
+        self.write(description)
+
 
 class MapModulePatched(MapModule):
     """
-    Patched MapModule to override the local_includes
+    Patched MapModule to override the local_includes.
+    Households are sent as GeoJSON features only in the first render of a model,
+    then each render only sends the portrayal of the households with a change
+    in any of portrayal_fields, and MapModule.js updates their markers in place.
+    Popups of portrayals without a description request it at HOUSEHOLD_URL when opened.
+    GeoJSON geometries are reused by the models whose agents share the same geometries,
+    e.g. models created with the same villages (see context.py).
+
+    Raster layers are colored by raster_colormap in a single pass over their values,
+    and sent as PNG images only when their version changes (see WaterLevelLayer),
+    with a downsampled image shown in zoomed-out views.
     """
     local_includes = [
         "visualizers/MapModule.js",
@@ -10,6 +64,179 @@ class MapModulePatched(MapModule):
         "visualizers/leaflet.js",
     ]
     local_dir = ""
-    
 
+    def __init__(
+        self,
+        portrayal_method=None,
+        view=None,
+        zoom=None,
+        map_width=500,
+        map_height=500,
+        portrayal_fields=None,
+        raster_colormap=None,
+    ):
+        """
+        Create a new MapModulePatched.
+        :param portrayal_fields:    Households attributes the portrayal of a household depends on,
+                                    if None every household is portrayed at every render
+        :param raster_colormap:     Function returning the (4, height, width) RGBA values
+                                    of a (height, width) raster band
+        See MapModule for the other parameters.
+        """
+        super().__init__(portrayal_method, view, zoom, map_width, map_height)
+        self.portrayal_fields = portrayal_fields
+        self.raster_colormap = raster_colormap
+        # (layer, version) -> image of the last rendered raster layers
+        self._images = {}
+        # model of the last render and its portrayal fields
+        self._model = None
+        self._state = None
+        # crs and agent geometries of the last GeoJSON geometries
+        self._geometries = None
+        self._features = None
+
+    def _render_image(self, values):
+        """
+        PNG data url of a raster band, and of its downsampled image
+        taking the maximum of each block of pixels if it's larger than LOW_RES_SIZE
+        """
+        factor = int(np.ceil(max(values.shape) / LOW_RES_SIZE))
+        height, width = values.shape
+        image = {
+            "url": image_to_url(self.raster_colormap(values).transpose([1, 2, 0])),
+            "width": width,
+        }
+        if factor <= 1:
+            return image
+
+        padded = np.zeros((-(-height // factor) * factor, -(-width // factor) * factor), dtype=values.dtype)
+        padded[:height, :width] = values
+        low_res = padded.reshape(
+            padded.shape[0] // factor, factor, padded.shape[1] // factor, factor
+        ).max(axis=(1, 3))
+        image["url_low"] = image_to_url(self.raster_colormap(low_res).transpose([1, 2, 0]))
+        image["width_low"] = low_res.shape[1]
+        return image
+
+    def _render_layers(self, model):
+        """
+        Raster images if any layer changed since the last render,
+        vector layers only on the first render of a model
+        """
+        first_render = self._model is None or self._model() is not model
+        raster_layers = [layer for layer in model.space.layers if isinstance(layer, RasterBase)]
+        images = {}
+        for layer in raster_layers:
+            key = (id(layer), getattr(layer, 'version', None))
+            if key in self._images and key[1] is not None:
+                images[key] = self._images[key]
+            elif isinstance(layer, RasterLayer) and self.raster_colormap is not None:
+                # rasters are in the map crs
+                images[key] = self._render_image(layer.get_raster()[0])
+            else:
+                if isinstance(layer, RasterLayer):
+                    layer = layer.to_image(colormap=self.portrayal_method)
+                values = layer.to_crs(self._crs).values.transpose([1, 2, 0])
+                images[key] = {"url": image_to_url(values), "width": values.shape[1]}
+
+        layers = {"total_bounds": []}
+        if first_render or images.keys() != self._images.keys():
+            layers["rasters"] = list(images.values())
+        self._images = images
+        if first_render:
+            layers["vectors"] = [
+                layer.to_crs(self._crs)[["geometry"]].__geo_interface__
+                for layer in model.space.layers if isinstance(layer, gpd.GeoDataFrame)
+            ]
+
+        # longlat [min_x, min_y, max_x, max_y] to latlong [min_y, min_x, max_y, max_x]
+        if model.space.total_bounds is not None:
+            transformed_xx, transformed_yy = model.space.transformer.transform(
+                xx=[model.space.total_bounds[0], model.space.total_bounds[2]],
+                yy=[model.space.total_bounds[1], model.space.total_bounds[3]],
+            )
+            layers["total_bounds"] = [
+                [transformed_yy[0], transformed_xx[0]],  # min_y, min_x
+                [transformed_yy[1], transformed_xx[1]],  # max_y, max_x
+            ]
+        return layers
+
+    def render(self, model):
+        # layers first, _render_agents sets the model of the last render
+        layers = self._render_layers(model)
+        return {
+            "layers": layers,
+            "agents": self._render_agents(model),
+        }
+
+    def _portray(self, agent):
+        """
+        Leaflet portrayal of agent, as the LeafletPortrayal of MapModule
+        """
+        properties = self.portrayal_method(agent)
+        description = properties.pop("description", None)
+        if isinstance(agent.geometry, Point):
+            agent_portrayal = {"pointToLayer": properties}
+        else:
+            agent_portrayal = {"style": properties}
+        if description is not None:
+            agent_portrayal["popupProperties"] = description
+        return agent_portrayal
+
+    def _get_geometries(self, model):
+        """
+        GeoJSON geometries of the agents in the map crs
+        """
+        geometries = (model.space.crs, [agent.geometry for agent in model.agents])
+        if self._geometries is None or self._geometries[0] != geometries[0] or \
+                len(self._geometries[1]) != len(geometries[1]) or \
+                any(a is not b for a, b in zip(self._geometries[1], geometries[1])):
+            self._geometries = geometries
+            self._features = [
+                mapping(agent.get_transformed_geometry(model.space.transformer))
+                for agent in model.agents
+            ]
+        return self._features
+
+    def _get_state(self, model):
+        return {
+            field: np.array(getattr(model.households, field))
+            for field in self.portrayal_fields
+        }
+
+    def _render_agents(self, model):
+        """
+        GeoJSON features of all the households on the first render of a model,
+        indexed by their position in model.agents, or the portrayal of the changed ones:
+        {"ids": [...], "portrayals": [...]}, with the step of the model
+        """
+        state = None if self.portrayal_fields is None else self._get_state(model)
+        first_render = self._model is None or self._model() is not model
+        self._model = weakref.ref(model)
+
+        if first_render:
+            self._state = state
+            features = [
+                {
+                    "type": "Feature",
+                    "geometry": geometry,
+                    "properties": self._portray(agent),
+                }
+                for agent, geometry in zip(model.agents, self._get_geometries(model))
+            ]
+            return {"type": "FeatureCollection", "features": features, "step": model.steps}
+
+        if state is None:
+            ids = range(len(model.agents))
+        else:
+            changed = np.zeros(len(model.agents), dtype=bool)
+            for field, values in state.items():
+                changed |= values != self._state[field]
+            ids = np.flatnonzero(changed).tolist()
+            self._state = state
 
+        return {
+            "step": model.steps,
+            "ids": list(ids),
+            "portrayals": [self._portray(model.agents[i]) for i in ids],
+        }
@@ -0,0 +1,20 @@
+from mesa.visualization.ModularVisualization import VisualizationElement
+
+
+class PlaybackModule(VisualizationElement):
+    """
+    Slider in the top bar to seek any step of a run buffered by RunAheadServer
+    """
+    local_includes = ["visualizers/PlaybackModule.js"]
+
+    def __init__(self, max_steps):
+        """
+        Create a new playback slider.
+        Args:
+            max_steps: Last step of the slider, e.g. MAX_YEARS
+        """
+        self.max_steps = max_steps
+        self.js_code = f"elements.push(new PlaybackModule({max_steps}));"
+
+    def render(self, model):
+        return model.schedule.steps